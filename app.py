@@ -1,16 +1,27 @@
 from memoboard.memoboard_builder import MemoboardBuilder
 from persona.pesrona_builder import PersonaBuilder
+from persona.email_prefilter import EmailPrefilter
+from persona.uniqueness_cache import UniquenessCache
 from llm.clients.ollama_client import OllamaClient
+from llm.cache import LLMResponseCache
+from llm.metrics import LLMMetrics
 import os
 import argparse
 from llm.clients.groq_client import GroqClient
+from llm.clients.routing_client import LLMBackend, RoutingLLMClient
 from data_loader.gmail_fetcher import GmailFetcher
 from data_loader.base_email_fetcher import EmailMessage
+from data_loader.email_store import ArchiveEmailStore, JsonFileEmailStore
 import datetime
 from dotenv import load_dotenv
 import sys
+from common.logger import get_logger, setup_logging
 
 load_dotenv(override=True)
+# Apply LOG_LEVEL from the .env file
+setup_logging()
+
+logger = get_logger(__name__)
 
 # from llm.ollama_client import OllamaClient
 
@@ -23,13 +34,33 @@ subparsers = parser.add_subparsers(dest="command", help="Available commands")
 persona_parser = subparsers.add_parser("persona", help="Build or update persona")
 persona_parser.add_argument("--email_addr", required=False, help="Email address")
 persona_parser.add_argument("--email_pwd", required=False, help="Email password")
-persona_parser.add_argument("--load_checkpoint", required=False, help="Checkpoint directory path")
+persona_parser.add_argument("--load_checkpoint", required=False, help="Persona directory of a previous run to continue from")
 persona_parser.add_argument("--days", type=int, default=3, help="Number of days to fetch emails")
+persona_parser.add_argument("--token_budget", type=int, default=2048, help="Estimated tokens allowed per batched prompt, should fit the model's context")
+persona_parser.add_argument("--max_batch_size", type=int, default=25, help="Maximum number of emails per batched prompt")
+persona_parser.add_argument("--persona_interval", type=int, default=1, help="Rewrite the persona every N batches, 0 to write it only at the end")
+persona_parser.add_argument("--email_storage", default="./data/emails", help="Directory where fetched emails and sync state are stored")
+persona_parser.add_argument("--incremental", action="store_true", help="Only fetch emails newer than the last synced email")
+persona_parser.add_argument("--headers_only", action="store_true", help="Only fetch email headers, which is all the persona builder needs")
+persona_parser.add_argument("--imap_connections", type=int, default=1, help="Number of parallel IMAP connections used to fetch emails")
+persona_parser.add_argument("--email_archive", action="store_true", help="Store emails in a compressed archive instead of one JSON file per email")
+persona_parser.add_argument("--skip_attachment_types", default="", help="Comma-separated attachment content types not to store, e.g. 'image/*,video/*'")
+persona_parser.add_argument("--no_prefilter", action="store_true", help="Send every email to the LLM instead of dropping bulk mail first")
+persona_parser.add_argument("--no_uniqueness_cache", action="store_true", help="Score every email with the LLM instead of reusing scores of known senders")
+persona_parser.add_argument("--data_dir", help="Output directory. Reuse a previous one to resume an interrupted run")
 
 # Memoboard builder command
 memoboard_parser = subparsers.add_parser("memoboard", help="Build memoboard")
 memoboard_parser.add_argument("--load_persona", required=True, help="Path to persona data")
-memoboard_parser.add_argument("--email", required=True, help="Path to email JSON file")
+memoboard_input = memoboard_parser.add_mutually_exclusive_group(required=True)
+memoboard_input.add_argument("--email", help="Path to email JSON file")
+memoboard_input.add_argument("--email_dir", help="Email storage directory to process all emails from")
+memoboard_input.add_argument("--email_archive", help="Path to email archive file to process all emails from")
+memoboard_parser.add_argument("--workers", type=int, default=4, help="Number of emails processed in parallel")
+memoboard_parser.add_argument("--batch_size", type=int, default=1, help="Maximum number of emails packed into one prompt")
+memoboard_parser.add_argument("--token_budget", type=int, default=6000, help="Maximum estimated prompt tokens of a batched prompt")
+memoboard_parser.add_argument("--data_dir", help="Output directory. Reuse a previous one to resume an interrupted run")
+memoboard_parser.add_argument("--no_dedup", action="store_true", help="Store every memo instead of merging near-duplicates of recent memos")
 
 args = parser.parse_args()
 
@@ -38,32 +69,71 @@ if args.command is None:
     sys.exit(1)
 
 # Setup LLM client
+llm_max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY") or 4)
+llm_cache = LLMResponseCache(
+    path=os.getenv("LLM_CACHE_PATH") or "./data/llm_cache.db",
+    ttl_seconds=int(os.getenv("LLM_CACHE_TTL_DAYS") or 30) * 24 * 3600,
+)
+llm_metrics = LLMMetrics(trace_path=os.getenv("LLM_TRACE_PATH") or None)
 if os.getenv("LLM_PROVIDER") == "ollama":
-    llm_client = OllamaClient(default_model=os.getenv("OLLAMA_MODEL") or "qwen2.5:7b")
+    llm_client = OllamaClient(default_model=os.getenv("OLLAMA_MODEL") or "qwen2.5:7b", max_concurrency=llm_max_concurrency, cache=llm_cache, metrics=llm_metrics,
+                              keep_alive=os.getenv("OLLAMA_KEEP_ALIVE") or "30m")
 elif os.getenv("LLM_PROVIDER") == "groq":
-    llm_client = GroqClient(api_key=os.getenv("GROQ_API_KEY"), default_model=os.getenv("GROQ_MODEL") or "llama-3.1-8b-instant")
-
-
-data_dir = f"./data/{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
+    llm_client = GroqClient(api_key=os.getenv("GROQ_API_KEY"), default_model=os.getenv("GROQ_MODEL") or "llama-3.1-8b-instant", max_concurrency=llm_max_concurrency, cache=llm_cache, metrics=llm_metrics)
+elif os.getenv("LLM_PROVIDER") == "router":
+    # OLLAMA_HOSTS: comma-separated "host[#model][*weight]", each named by its "host[#model]" part
+    llm_backends = []
+    for entry in filter(None, (entry.strip() for entry in (os.getenv("OLLAMA_HOSTS") or "").split(","))):
+        backend_name, _, weight = entry.partition("*")
+        host, _, model = backend_name.partition("#")
+        llm_backends.append(LLMBackend(name=backend_name, weight=float(weight or 1), client=OllamaClient(
+            host=host, default_model=model or os.getenv("OLLAMA_MODEL") or "qwen2.5:7b", max_concurrency=llm_max_concurrency,
+            cache=llm_cache, metrics=llm_metrics, keep_alive=os.getenv("OLLAMA_KEEP_ALIVE") or "30m")))
+    if os.getenv("GROQ_API_KEY"):
+        llm_backends.append(LLMBackend(name="groq", weight=float(os.getenv("GROQ_WEIGHT") or 1), client=GroqClient(
+            api_key=os.getenv("GROQ_API_KEY"), default_model=os.getenv("GROQ_MODEL") or "llama-3.1-8b-instant",
+            max_concurrency=llm_max_concurrency, cache=llm_cache, metrics=llm_metrics)))
+    # LLM_ROUTES: semicolon-separated "TemplateName=backend1,backend2"
+    llm_routes = {}
+    for route in filter(None, (route.strip() for route in (os.getenv("LLM_ROUTES") or "").split(";"))):
+        template_name, _, backend_names = route.partition("=")
+        llm_routes[template_name.strip()] = [name.strip() for name in backend_names.split(",") if name.strip()]
+    llm_client = RoutingLLMClient(
+        backends=llm_backends,
+        routes=llm_routes,
+        strategy=os.getenv("LLM_ROUTER_STRATEGY") or "least_outstanding",
+        timeout_seconds=float(os.getenv("LLM_ROUTER_TIMEOUT_SECONDS")) if os.getenv("LLM_ROUTER_TIMEOUT_SECONDS") else None,
+    )
+
+
+data_dir = getattr(args, "data_dir", None) or f"./data/{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
 
 
 persona_desc = None
 
 # Handle Build Persona command
 if args.command == "persona":
-    persona_builder = PersonaBuilder(llm_client=llm_client, storage_path=data_dir)
+    persona_builder = PersonaBuilder(llm_client=llm_client, storage_path=data_dir, token_budget=args.token_budget, max_batch_size=args.max_batch_size,
+                                     persona_write_interval=args.persona_interval,
+                                     prefilter=None if args.no_prefilter else EmailPrefilter(storage_path=args.email_storage),
+                                     uniqueness_cache=None if args.no_uniqueness_cache else UniquenessCache(storage_path=args.email_storage))
 
     if args.load_checkpoint:
         persona_builder.load_checkpoint(args.load_checkpoint)
+    elif os.path.exists(f"{data_dir}/persona"):
+        persona_builder.load_checkpoint(f"{data_dir}/persona")
 
     if args.email_addr and args.email_pwd:
         gmail_fetcher = GmailFetcher(
             email=args.email_addr,
             password=args.email_pwd,
-            storage_path=data_dir
+            storage_path=args.email_storage,
+            max_connections=args.imap_connections,
+            skip_content_types=[t.strip() for t in args.skip_attachment_types.split(",") if t.strip()],
+            email_store=ArchiveEmailStore(f"{args.email_storage}/emails.db") if args.email_archive else None
         )
-        gmail_messages = gmail_fetcher.fetch_emails(days=args.days)
-        persona_builder.digest_emails(gmail_messages)
+        gmail_messages = gmail_fetcher.iter_emails(days=args.days, incremental=args.incremental, header_only=args.headers_only)
+        persona_builder.digest_stream(gmail_messages)
 
     persona_desc = persona_builder.get_persona()
 
@@ -72,13 +142,28 @@ elif args.command == "memoboard":
     with open(args.load_persona, "r") as file:
         persona_desc = file.read()
 
-    with open(args.email, "r") as file:
-        email_content = EmailMessage.model_validate_json(file.read())
+    memoboard_builder = MemoboardBuilder(llm_client, persona_desc, data_dir, dedup=not args.no_dedup)
 
-    memoboard_builder = MemoboardBuilder(llm_client, persona_desc, data_dir)
-    memos = memoboard_builder.process_email(email_content)
+    if args.email:
+        with open(args.email, "r") as file:
+            email_content = EmailMessage.model_validate_json(file.read())
+        memo_count = len(memoboard_builder.process_email(email_content))
+    else:
+        email_store = JsonFileEmailStore(args.email_dir) if args.email_dir else ArchiveEmailStore(args.email_archive)
+        memo_count = memoboard_builder.process_emails(email_store.iter(), max_workers=args.workers, batch_size=args.batch_size, token_budget=args.token_budget)
+
+    logger.info(f"{memo_count} memos extracted, {memoboard_builder.merged_count} of them merged into duplicate memos")
+    logger.info(f"Memoboard categories: {memoboard_builder.memo_store.categories()}")
 
 else:
     print("Invalid command")
     parser.print_help()
     sys.exit(1)
+
+logger.info(f"LLM response cache: {llm_cache.stats()}")
+if isinstance(llm_client, RoutingLLMClient):
+    logger.info(f"LLM backends: {llm_client.stats()}")
+logger.info(f"LLM usage by template:\n{llm_metrics.summary()}")
+llm_metrics.write_prometheus(os.getenv("LLM_METRICS_PATH") or "./data/llm_metrics.prom")
+llm_metrics.close()
+llm_cache.close()
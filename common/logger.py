@@ -1,10 +1,28 @@
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import os
+import queue
 import sys
+from typing import Optional
 
+_file_listener: Optional[QueueListener] = None
+
+
+def setup_logging(default_level=None):
+    """Initialize the root logger with default configuration
+
+    The level comes from `default_level`, else the LOG_LEVEL environment variable, else INFO.
+    Calling it again only updates the level, e.g. once a .env file has been loaded.
+    """
+    global _file_listener
+
+    # App logger
+    app_logger = logging.getLogger('app')
+    app_logger.setLevel(default_level or os.getenv("LOG_LEVEL", "INFO").upper())
+    if _file_listener is not None:
+        return
 
-def setup_logging(default_level=logging.INFO):
-    """Initialize the root logger with default configuration"""
     # Create formatters
     file_formatter = logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s'
@@ -13,24 +31,25 @@ def setup_logging(default_level=logging.INFO):
         '%(asctime)s [%(name)s] %(levelname)s - %(message)s'
     )
 
-    # App logger
-    app_logger = logging.getLogger('app')
-    app_logger.setLevel(default_level)
-
-    # File handler
+    # File handler, fed through a queue so logging threads never wait on disk writes or rotation
     file_handler = RotatingFileHandler(
-        'app.log',
+        os.getenv("LOG_FILE", "app.log"),
         maxBytes=10*1024*1024,
         backupCount=5
     )
     file_handler.setFormatter(file_formatter)
+    log_queue: queue.Queue = queue.Queue(-1)
+    _file_listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _file_listener.start()
+    # Flush the queued records on exit
+    atexit.register(_file_listener.stop)
 
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(console_formatter)
 
     # Add handlers to root logger
-    app_logger.addHandler(file_handler)
+    app_logger.addHandler(QueueHandler(log_queue))
     app_logger.addHandler(console_handler)
 
 
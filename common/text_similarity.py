@@ -0,0 +1,79 @@
+from collections import defaultdict
+import random
+import re
+from typing import Dict, FrozenSet, Generic, Hashable, Iterable, List, Set, TypeVar
+import zlib
+
+K = TypeVar('K', bound=Hashable)
+
+STOPWORDS = frozenset("""
+a an the and or of to in on at for from by with as is are was were be been being has have had do does did
+it its this that these those he she they his her their my our your i we you me him them
+likely probably possibly may might seems seem also very
+""".split())
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def normalize_text(text: str) -> str:
+    """
+    Lowercase, strip punctuation and collapse whitespace.
+    """
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def tokenize(text: str) -> FrozenSet[str]:
+    """
+    Normalized content words of a text, ignoring stopwords.
+    """
+    return frozenset(word for word in normalize_text(text).split() if word not in STOPWORDS)
+
+
+def jaccard(a: Set[str] | FrozenSet[str], b: Set[str] | FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHashIndex(Generic[K]):
+    """
+    Locality-sensitive index over token sets using MinHash with banding.
+
+    Token sets whose Jaccard similarity is high are likely to share at least one band,
+    so near-duplicate candidates are found without comparing against every entry.
+    """
+
+    def __init__(self, num_perm: int = 32, bands: int = 8):
+        """
+        Args:
+            num_perm: Number of hash permutations in a signature
+            bands: Number of bands the signature is split into. More bands find less similar candidates
+        """
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self._rows = num_perm // bands
+        # Coefficients must span the prime's range, otherwise a*h+b never wraps and every permutation keeps the order of h.
+        # A fixed seed keeps signatures comparable across instances and runs
+        rng = random.Random(0x5EED)
+        self._permutations = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(1, _MERSENNE_PRIME)) for _ in range(num_perm)]
+        self._buckets: List[Dict[tuple, Set[K]]] = [defaultdict(set) for _ in range(bands)]
+
+    def insert(self, key: K, tokens: Iterable[str]) -> None:
+        for band, bucket in zip(self._bands(tokens), self._buckets):
+            bucket[band].add(key)
+
+    def query(self, tokens: Iterable[str]) -> Set[K]:
+        """
+        Keys sharing at least one band with the token set.
+        """
+        candidates: Set[K] = set()
+        for band, bucket in zip(self._bands(tokens), self._buckets):
+            candidates |= bucket.get(band, set())
+        return candidates
+
+    def _bands(self, tokens: Iterable[str]) -> List[tuple]:
+        hashes = [zlib.crc32(token.encode('utf-8')) for token in tokens] or [0]
+        signature = [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._permutations]
+        return [tuple(signature[i:i + self._rows]) for i in range(0, self.num_perm, self._rows)]
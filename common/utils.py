@@ -1,10 +1,88 @@
 import os
+import queue
+import tempfile
+import threading
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar('T')
 
 
 def safe_write_file(path: str, content: str):
-    """Write content to a file, creating directory structure if needed."""
+    """Write content to a file, creating directory structure if needed.
+
+    The content is written to a temporary file in the same directory and renamed over the target,
+    so readers and crashes only ever see the old or the new file, never a partial one.
+    """
     # Create directory structure if it doesn't exist
-    os.makedirs(os.path.dirname(path), exist_ok=True)
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def append_line(path: str, line: str):
+    """Append a line to a file and flush it to disk, creating directory structure if needed."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(f"{line}\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def prefetch(iterable: Iterable[T], buffer_size: int) -> Iterator[T]:
+    """
+    Iterate over `iterable` in a background thread, keeping up to `buffer_size` items ready.
+
+    This lets a slow producer (e.g. network fetch) run while the consumer is busy with previous items.
+    Exceptions raised by the producer are re-raised in the consumer.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=max(1, buffer_size))
+    stopped = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    break
+            else:
+                put((done, None))
+        except BaseException as e:
+            put((done, e))
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
 
-    with open(path, 'w', encoding='utf-8') as f:
-        f.write(content)
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+        producer.join()
@@ -1,60 +1,83 @@
 from abc import abstractmethod
-from datetime import datetime
-from typing import Dict, List, Optional
-from pydantic import BaseModel
+from fnmatch import fnmatch
+from typing import Iterator, List, Optional
 from pathlib import Path
-import json
 
-
-class EmailMessage(BaseModel):
-    subject: str
-    sender: str
-    to: Optional[str]
-    cc: Optional[str]
-    date: datetime
-    body: str
-    attachments: List[Dict[str, str | None]]
-    message_id: str
-    provider: str
+from data_loader.blob_store import BlobStore
+from data_loader.email_message import Attachment, EmailMessage
+from data_loader.email_store import BaseEmailStore, JsonFileEmailStore
 
 
 class BaseEmailFetcher:
-    def __init__(self, storage_path: str = "emails"):
+    def __init__(self,
+                 storage_path: str = "emails",
+                 skip_content_types: Optional[List[str]] = None,
+                 email_store: Optional[BaseEmailStore] = None):
         """
         Initialize the email fetcher with storage path configuration.
 
         Args:
             storage_path: Directory path where emails will be stored
+            skip_content_types: Attachment content types to drop entirely, wildcards allowed (e.g. "image/*")
+            email_store: Backend the emails are saved to. Defaults to one JSON file per email under the storage path
         """
         self.storage_path = Path(storage_path)
         self.storage_path.mkdir(parents=True, exist_ok=True)
+        self.email_store = email_store or JsonFileEmailStore(self.storage_path)
+        self.blob_store = BlobStore(self.storage_path / "blobs")
+        self.skip_content_types = skip_content_types or []
+
+    def _store_attachment(self, filename: Optional[str], content_type: str, data: bytes) -> Optional[Attachment]:
+        """
+        Store an attachment's content in the blob store.
+
+        Args:
+            filename: Original filename of the attachment
+            content_type: MIME type of the attachment
+            data: Decoded content of the attachment
+
+        Returns:
+            Reference to the stored attachment, or None if its content type is skipped
+        """
+        if any(fnmatch(content_type, pattern) for pattern in self.skip_content_types):
+            return None
+
+        sha256 = self.blob_store.put(data)
+        return Attachment(filename=filename, content_type=content_type, sha256=sha256, size=len(data)).bind(self.blob_store)
 
     def _save_email(self, email_data: EmailMessage) -> None:
         """
-        Save email data to JSON file.
+        Save email data to the email store.
 
         Args:
             email_data: EmailMessage object containing email information
         """
-        email_dict = {
-            "subject": email_data.subject,
-            "sender": email_data.sender,
-            "to": email_data.to,
-            "cc": email_data.cc,
-            "date": email_data.date.isoformat(),
-            "body": email_data.body,
-            "attachments": email_data.attachments,
-            "message_id": email_data.message_id,
-            "provider": email_data.provider
-        }
-
-        filename = f"{email_data.date.strftime('%Y%m%d_%H%M%S')}_{email_data.message_id}.json"
-        filepath = self.storage_path / email_data.provider / filename
-        filepath.parent.mkdir(parents=True, exist_ok=True)
-
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(email_dict, f, ensure_ascii=False, indent=2)
+        self.email_store.save(email_data)
+
+    def _load_email(self, message_id: str) -> Optional[EmailMessage]:
+        """
+        Load a previously saved email.
+
+        Args:
+            message_id: Message ID of the email
+        """
+        email_message = self.email_store.get(message_id)
+        if email_message is not None:
+            for attachment in email_message.attachments:
+                attachment.bind(self.blob_store)
+        return email_message
 
     @abstractmethod
     def fetch_emails(self, days: int = 3) -> List[EmailMessage]:
         pass
+
+    def iter_emails(self, days: int = 3) -> Iterator[EmailMessage]:
+        """
+        Stream emails instead of collecting them into a list.
+
+        Fetchers that can fetch incrementally should override this, the default falls back to `fetch_emails`.
+
+        Args:
+            days: Number of days of emails to fetch
+        """
+        yield from self.fetch_emails(days)
@@ -0,0 +1,60 @@
+import hashlib
+import os
+from pathlib import Path
+import tempfile
+
+
+class BlobStore:
+    """
+    Content-addressed storage of binary blobs (e.g. email attachments).
+
+    Each blob is written once under `<root>/<first 2 hex chars>/<sha256>`,
+    so identical attachments across emails share a single file.
+    """
+
+    def __init__(self, root: str | Path):
+        """
+        Args:
+            root: Directory where blobs are stored
+        """
+        self.root = Path(root)
+
+    def put(self, data: bytes) -> str:
+        """
+        Store a blob if it is not stored yet.
+
+        Args:
+            data: Content of the blob
+
+        Returns:
+            SHA-256 hex digest identifying the blob
+        """
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self.path(sha256)
+        if path.exists():
+            return sha256
+
+        # Write to a temporary file first so a crash never leaves a truncated blob behind
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return sha256
+
+    def get(self, sha256: str) -> bytes:
+        """
+        Read a blob by its digest.
+        """
+        with open(self.path(sha256), 'rb') as f:
+            return f.read()
+
+    def exists(self, sha256: str) -> bool:
+        return self.path(sha256).exists()
+
+    def path(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256
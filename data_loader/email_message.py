@@ -0,0 +1,66 @@
+import base64
+from datetime import datetime
+import hashlib
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, PrivateAttr, model_validator
+
+from data_loader.blob_store import BlobStore
+
+
+class Attachment(BaseModel):
+    """
+    Reference to an attachment whose content lives in a BlobStore.
+
+    Emails saved before the blob store embed the content as base64 `data`. It is kept inline
+    until the attachment is bound to a blob store, which moves it there.
+    """
+    filename: Optional[str]
+    content_type: str
+    sha256: str
+    size: int
+    # Base64 content of an attachment saved before the blob store, None once offloaded
+    data: Optional[str] = None
+
+    _blob_store: Optional[BlobStore] = PrivateAttr(default=None)
+
+    @model_validator(mode='before')
+    @classmethod
+    def _from_legacy(cls, values: Any) -> Any:
+        if isinstance(values, dict) and "sha256" not in values:
+            content = base64.b64decode(values.get("data") or "")
+            values = {**values, "data": values.get("data") or "", "sha256": hashlib.sha256(content).hexdigest(), "size": len(content)}
+        return values
+
+    def bind(self, blob_store: BlobStore) -> "Attachment":
+        """
+        Attach the blob store the content is loaded from, moving inline legacy content into it.
+        """
+        if self.data is not None:
+            blob_store.put(base64.b64decode(self.data))
+            self.data = None
+        self._blob_store = blob_store
+        return self
+
+    def load(self) -> bytes:
+        """
+        Read the attachment content from the blob store, or from the inline legacy content.
+        """
+        if self.data is not None:
+            return base64.b64decode(self.data)
+        if self._blob_store is None:
+            raise ValueError(f"Attachment {self.sha256} is not bound to a blob store")
+        return self._blob_store.get(self.sha256)
+
+
+class EmailMessage(BaseModel):
+    subject: str
+    sender: str
+    to: Optional[str]
+    cc: Optional[str]
+    date: datetime
+    body: str
+    attachments: List[Attachment]
+    message_id: str
+    provider: str
+    # Mailing list headers (e.g. "List-Unsubscribe", "Precedence") used to tell bulk mail apart
+    headers: Dict[str, str] = {}
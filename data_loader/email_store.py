@@ -0,0 +1,188 @@
+from abc import abstractmethod
+from datetime import datetime, timezone
+from pathlib import Path
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional
+import zlib
+
+from data_loader.email_message import EmailMessage
+
+
+def _utc(date: datetime) -> datetime:
+    """
+    Normalize a date to UTC so naive and aware dates compare. Naive dates are taken as local time.
+    """
+    return date.astimezone(timezone.utc)
+
+
+class BaseEmailStore:
+    """
+    Storage backend of fetched emails.
+    """
+
+    @abstractmethod
+    def save(self, email_data: EmailMessage) -> None:
+        pass
+
+    @abstractmethod
+    def contains(self, message_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def get(self, message_id: str) -> Optional[EmailMessage]:
+        pass
+
+    @abstractmethod
+    def iter(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Iterator[EmailMessage]:
+        """
+        Iterate over stored emails in date order.
+
+        Args:
+            start: Only include emails sent at or after this time
+            end: Only include emails sent before this time
+        """
+        pass
+
+    def load(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[EmailMessage]:
+        """
+        Load stored emails within a date range in date order.
+        """
+        return list(self.iter(start, end))
+
+
+class JsonFileEmailStore(BaseEmailStore):
+    """
+    Stores each email as an indented JSON file under `<root>/<provider>/`.
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        self._index: Optional[Dict[str, Path]] = None
+        self._lock = threading.Lock()
+
+    def save(self, email_data: EmailMessage) -> None:
+        filename = f"{email_data.date.strftime('%Y%m%d_%H%M%S')}_{email_data.message_id}.json"
+        filepath = self.root / email_data.provider / filename
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(email_data.model_dump(mode='json'), f, ensure_ascii=False, indent=2)
+
+        with self._lock:
+            if self._index is not None:
+                self._index[email_data.message_id] = filepath
+
+    def contains(self, message_id: str) -> bool:
+        return message_id in self._get_index()
+
+    def get(self, message_id: str) -> Optional[EmailMessage]:
+        path = self._get_index().get(message_id)
+        return self._read(path) if path is not None else None
+
+    def iter(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Iterator[EmailMessage]:
+        for path in sorted(self._get_index().values(), key=lambda p: p.name):
+            email_data = self._read(path)
+            date = _utc(email_data.date)
+            if (start is None or date >= _utc(start)) and (end is None or date < _utc(end)):
+                yield email_data
+
+    def _get_index(self) -> Dict[str, Path]:
+        """
+        Map message IDs to saved files, scanning the directory once.
+        """
+        with self._lock:
+            if self._index is None:
+                # Saved filenames are "{date}_{time}_{message_id}.json"
+                self._index = {path.stem.split('_', 2)[2]: path for path in self.root.glob("*/*_*_*.json")}
+            return self._index
+
+    @staticmethod
+    def _read(path: Path) -> EmailMessage:
+        with open(path, 'r', encoding='utf-8') as f:
+            return EmailMessage.model_validate_json(f.read())
+
+
+class ArchiveEmailStore(BaseEmailStore):
+    """
+    Append-only email archive in a single SQLite file.
+
+    Each email is stored once as zlib-compressed JSON, indexed by message ID and date,
+    which avoids one file per email and makes date-range reads sequential.
+    """
+
+    def __init__(self, path: str | Path):
+        """
+        Args:
+            path: Path of the archive database file
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS email (
+                message_id TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                date TEXT NOT NULL,
+                data BLOB NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_email_date ON email (date)")
+        self._conn.commit()
+
+    def save(self, email_data: EmailMessage) -> None:
+        self.save_many([email_data])
+
+    def save_many(self, emails: List[EmailMessage]) -> None:
+        """
+        Append emails in a single transaction. Emails already archived are left untouched.
+        """
+        rows = [(
+            email_data.message_id,
+            email_data.provider,
+            self._date_key(email_data.date),
+            zlib.compress(email_data.model_dump_json().encode('utf-8')),
+        ) for email_data in emails]
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO email (message_id, provider, date, data) VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def contains(self, message_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM email WHERE message_id = ?", (message_id,)).fetchone() is not None
+
+    def get(self, message_id: str) -> Optional[EmailMessage]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM email WHERE message_id = ?", (message_id,)).fetchone()
+        return self._decode(row[0]) if row is not None else None
+
+    def iter(self, start: Optional[datetime] = None, end: Optional[datetime] = None, batch_size: int = 500) -> Iterator[EmailMessage]:
+        query = "SELECT date, message_id, data FROM email WHERE date >= ? AND date < ? AND (date > ? OR (date = ? AND message_id > ?)) ORDER BY date, message_id LIMIT ?"
+        lower = self._date_key(start) if start is not None else ""
+        upper = self._date_key(end) if end is not None else "￿"
+
+        # Page through the date index so the lock is not held while the caller consumes emails
+        cursor_date, cursor_id = "", ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(query, (lower, upper, cursor_date, cursor_date, cursor_id, batch_size)).fetchall()
+            for _, _, data in rows:
+                yield self._decode(data)
+            if len(rows) < batch_size:
+                return
+            cursor_date, cursor_id = rows[-1][0], rows[-1][1]
+
+    def close(self) -> None:
+        self._conn.close()
+
+    @staticmethod
+    def _date_key(date: datetime) -> str:
+        return _utc(date).strftime('%Y%m%dT%H%M%S')
+
+    @staticmethod
+    def _decode(data: bytes) -> EmailMessage:
+        return EmailMessage.model_validate_json(zlib.decompress(data))
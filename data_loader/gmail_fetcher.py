@@ -1,19 +1,35 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import imaplib
 import email
 from email.header import decode_header
+from email.message import Message
 from datetime import datetime, timedelta
-from typing import List
+import json
+import re
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
 from dateutil import parser
-import base64
 from common.logger import get_logger
+from common.utils import safe_write_file
 
 from data_loader.base_email_fetcher import BaseEmailFetcher, EmailMessage
+from data_loader.email_store import BaseEmailStore
+from data_loader.imap_connection_pool import IMAP_DISCONNECT_ERRORS, ImapConnectionPool
 
 logger = get_logger(__name__)
 
 
 class GmailFetcher(BaseEmailFetcher):
-    def __init__(self, email: str, password: str, storage_path: str = "emails"):
+    def __init__(self,
+                 email: str,
+                 password: str,
+                 storage_path: str = "emails",
+                 fetch_batch_size: int = 100,
+                 max_connections: int = 1,
+                 max_retries: int = 3,
+                 skip_content_types: Optional[List[str]] = None,
+                 email_store: Optional[BaseEmailStore] = None):
         """
         Initialize Gmail fetcher with credentials.
 
@@ -21,72 +37,270 @@ class GmailFetcher(BaseEmailFetcher):
             email: Gmail email address
             password: App-specific password or account password
             storage_path: Directory path where emails will be stored
+            fetch_batch_size: Number of messages requested per IMAP FETCH command
+            max_connections: Number of IMAP connections fetching batches in parallel. 1 fetches sequentially
+            max_retries: Number of times a batch is retried on a fresh connection after a disconnect
+            skip_content_types: Attachment content types to drop entirely, wildcards allowed (e.g. "image/*")
+            email_store: Backend the emails are saved to. Defaults to one JSON file per email under the storage path
         """
-        super().__init__(storage_path)
+        super().__init__(storage_path, skip_content_types=skip_content_types, email_store=email_store)
         self.email = email
         self.password = password
         self.imap_server = "imap.gmail.com"
+        self.fetch_batch_size = fetch_batch_size
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.extra_headers = ["List-Unsubscribe", "List-Id", "Precedence", "Auto-Submitted"]
+        self.header_fields = ["SUBJECT", "FROM", "TO", "CC", "DATE", "MESSAGE-ID"] + [h.upper() for h in self.extra_headers]
+        self._sync_state_path = self.storage_path / "gmail" / "sync_state.json"
 
-    def fetch_emails(self, days: int = 3) -> List[EmailMessage]:
+    def fetch_emails(self, days: int = 3, incremental: bool = False, mailbox: str = "INBOX", header_only: bool = False) -> List[EmailMessage]:
+        """
+        Fetch emails of the last `days` days from a mailbox.
+
+        See `iter_emails` for the arguments.
+        """
+        return list(self.iter_emails(days=days, incremental=incremental, mailbox=mailbox, header_only=header_only))
+
+    def iter_emails(self, days: int = 3, incremental: bool = False, mailbox: str = "INBOX", header_only: bool = False) -> Iterator[EmailMessage]:
+        """
+        Stream emails of the last `days` days from a mailbox in UID order, one FETCH batch at a time.
+
+        Emails already saved in the storage path are loaded from disk instead of being downloaded again.
+        The watermark is only advanced once the whole window has been consumed.
+
+        Args:
+            days: Number of days of emails to fetch
+            incremental: Only return emails with a UID above the mailbox's persisted watermark
+            mailbox: Mailbox to fetch from
+            header_only: Only fetch subject, date, sender and recipient headers, skipping bodies and attachments.
+                Header-only emails are not saved, and keep a separate watermark from full fetches.
+        """
+        pool = None
         try:
             # Connect to Gmail
-            mail = imaplib.IMAP4_SSL(self.imap_server)
-            mail.login(self.email, self.password)
-            mail.select('INBOX')
+            mail = self._connect(mailbox)
+            uid_validity = int(mail.response('UIDVALIDITY')[1][0])
+            pool = ImapConnectionPool(lambda: self._connect(mailbox), size=self.max_connections, initial=mail)
 
             # Calculate date range
             date_from = (datetime.now() - timedelta(days=days)).strftime("%d-%b-%Y")
 
-            # Search for emails within date range
-            _, messages = mail.search(None, f'(SINCE {date_from})')
-            email_messages = []
-
-            for num in messages[0].split():
-                _, msg_data = mail.fetch(num, '(RFC822)')
-                email_body = msg_data[0][1]
-                email_msg = email.message_from_bytes(email_body)
-
-                # Process email
-                subject = decode_header(email_msg["Subject"])[0][0]
-                subject = subject if isinstance(subject, str) else subject.decode()
-                sender = email_msg["From"]
-                to = email_msg["To"]
-                cc = email_msg["Cc"]
-                date = parser.parse(email_msg["Date"])
-
-                # Get body and attachments
-                body = ""
-                attachments = []
-
-                for part in email_msg.walk():
-                    if part.get_content_type() == "text/plain":
-                        body = part.get_payload(decode=True).decode()
-                    elif part.get_content_maintype() != 'multipart':
-                        attachment_data = {
-                            "filename": part.get_filename(),
-                            "content_type": part.get_content_type(),
-                            "data": base64.b64encode(part.get_payload(decode=True)).decode()
-                        }
-                        attachments.append(attachment_data)
-
-                email_message = EmailMessage(
-                    subject=subject,
-                    sender=sender,
-                    to=to,
-                    cc=cc,
-                    date=date,
-                    body=body,
-                    attachments=attachments,
-                    message_id=email_msg["Message-ID"],
-                    provider="gmail"
-                )
-
-                self._save_email(email_message)
-                email_messages.append(email_message)
-
-            mail.logout()
-            return email_messages
+            # Search for emails within date range, starting after the watermark if it is still valid
+            sync_key = f"{mailbox}:headers" if header_only else mailbox
+            watermark = self._load_sync_state().get(sync_key)
+            last_uid = 0
+            if incremental and watermark is not None and watermark["uidvalidity"] == uid_validity:
+                last_uid = watermark["last_uid"]
+                _, messages = mail.uid('SEARCH', None, f'(UID {last_uid + 1}:* SINCE {date_from})')
+            else:
+                _, messages = mail.uid('SEARCH', None, f'(SINCE {date_from})')
+
+            # "n:*" always matches the latest message, even when its UID is below n
+            uids = sorted(uid for uid in (int(u) for u in messages[0].split()) if uid > last_uid)
+            logger.info(f"Found {len(uids)} emails in {mailbox} since {date_from}")
+
+            if header_only:
+                for raw_messages in self._iter_raw(pool, uids, self._header_query):
+                    for raw in raw_messages.values():
+                        yield self._parse_email(email.message_from_bytes(raw))
+            else:
+                yield from self._iter_full_messages(pool, uids)
+
+            if uids:
+                self._save_sync_state(sync_key, uid_validity, max(uids))
 
         except Exception as e:
             logger.error(f"Error fetching Gmail: {str(e)}")
             raise
+
+        finally:
+            if pool is not None:
+                pool.close()
+
+    def _connect(self, mailbox: str) -> imaplib.IMAP4_SSL:
+        """
+        Open an authenticated connection with the mailbox selected read-only.
+        """
+        mail = imaplib.IMAP4_SSL(self.imap_server)
+        mail.login(self.email, self.password)
+        mail.select(mailbox, readonly=True)
+        return mail
+
+    def _iter_full_messages(self, pool: ImapConnectionPool, uids: List[int]) -> Iterator[EmailMessage]:
+        """
+        Stream full messages of the given UIDs in UID order, reusing the ones already saved on disk.
+        """
+        message_ids = self._fetch_message_ids(pool, uids)
+        saved = {uid for uid, message_id in message_ids.items() if message_id is not None and self.email_store.contains(message_id)}
+
+        missing_uids = [uid for uid in message_ids if uid not in saved]
+        fetched_batches = self._iter_raw(pool, missing_uids, '(UID RFC822)')
+        batch_last_uids = iter([chunk[-1] for chunk in self._chunks(missing_uids)])
+        fetched: Dict[int, bytes] = {}
+        fetched_up_to = 0
+
+        for uid, message_id in message_ids.items():
+            if uid in saved:
+                yield self._load_email(message_id)
+                continue
+
+            # Batches arrive in UID order, so pull the next one once the current batch is used up
+            while uid > fetched_up_to:
+                fetched = next(fetched_batches)
+                fetched_up_to = next(batch_last_uids)
+
+            raw = fetched.pop(uid, None)
+            if raw is None:
+                logger.warning(f"Email UID {uid} missing from FETCH response")
+                continue
+            email_message = self._parse_email(email.message_from_bytes(raw))
+            self._save_email(email_message)
+            yield email_message
+
+    def _fetch_message_ids(self, pool: ImapConnectionPool, uids: List[int]) -> Dict[int, Optional[str]]:
+        """
+        Fetch only the Message-ID header of the given UIDs, in UID order.
+        """
+        message_ids: Dict[int, Optional[str]] = {}
+        for raw_messages in self._iter_raw(pool, uids, '(UID BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])'):
+            for uid, raw in raw_messages.items():
+                message_ids[uid] = email.message_from_bytes(raw)["Message-ID"]
+        return message_ids
+
+    def _iter_raw(self, pool: ImapConnectionPool, uids: List[int], query: str) -> Iterator[Dict[int, bytes]]:
+        """
+        Fetch the given UIDs with one FETCH command per batch, spreading batches across the pool's connections.
+
+        At most two batches per connection are requested ahead of the consumer, so memory stays bounded
+        by the batch size rather than the number of UIDs.
+
+        Yields:
+            Mapping of UID to the fetched literal for each batch, in UID order
+        """
+        chunks = self._chunks(uids)
+        if pool.size == 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                yield dict(sorted(self._fetch_chunk(pool, chunk, query).items()))
+            return
+
+        with ThreadPoolExecutor(max_workers=pool.size) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(self._fetch_chunk, pool, chunk, query))
+                if len(pending) >= pool.size * 2:
+                    yield dict(sorted(pending.popleft().result().items()))
+            while pending:
+                yield dict(sorted(pending.popleft().result().items()))
+
+    def _fetch_chunk(self, pool: ImapConnectionPool, chunk: List[int], query: str) -> Dict[int, bytes]:
+        """
+        Fetch one batch of UIDs, retrying on a fresh connection if the connection drops.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                with pool.connection() as mail:
+                    _, msg_data = mail.uid('FETCH', self._uid_set(chunk), query)
+                return dict(self._iter_fetch_response(msg_data))
+            except IMAP_DISCONNECT_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"IMAP connection lost while fetching {len(chunk)} emails, retrying ({attempt + 1}/{self.max_retries}): {str(e)}")
+                time.sleep(2 ** attempt)
+
+    @property
+    def _header_query(self) -> str:
+        return f"(UID BODY.PEEK[HEADER.FIELDS ({' '.join(self.header_fields)})])"
+
+    def _chunks(self, uids: List[int]) -> List[List[int]]:
+        return [uids[i:i + self.fetch_batch_size] for i in range(0, len(uids), self.fetch_batch_size)]
+
+    @staticmethod
+    def _uid_set(uids: List[int]) -> str:
+        """
+        Compress sorted UIDs into an IMAP sequence set, e.g. [1, 2, 3, 7] -> "1:3,7".
+        """
+        ranges = []
+        start = prev = uids[0]
+        for uid in uids[1:]:
+            if uid != prev + 1:
+                ranges.append(f"{start}:{prev}" if start != prev else str(start))
+                start = uid
+            prev = uid
+        ranges.append(f"{start}:{prev}" if start != prev else str(start))
+        return ",".join(ranges)
+
+    @staticmethod
+    def _iter_fetch_response(msg_data: list) -> Iterator[Tuple[int, bytes]]:
+        """
+        Yield (UID, literal) pairs from a UID FETCH response.
+
+        Each message comes back as a (b'<seq> (UID <uid> <item> {<size>}', literal) tuple followed by b')',
+        though servers may also place the UID item after the literal.
+        """
+        for idx, item in enumerate(msg_data):
+            if not isinstance(item, tuple):
+                continue
+            match = re.search(rb'UID (\d+)', item[0])
+            if match is None and idx + 1 < len(msg_data) and isinstance(msg_data[idx + 1], bytes):
+                match = re.search(rb'UID (\d+)', msg_data[idx + 1])
+            if match is None:
+                logger.warning(f"Skipping FETCH response without UID: {item[0]!r}")
+                continue
+            yield int(match.group(1)), item[1]
+
+    def _parse_email(self, email_msg: Message) -> EmailMessage:
+        """
+        Convert a raw email message into EmailMessage.
+        """
+        subject = decode_header(email_msg["Subject"])[0][0]
+        subject = subject if isinstance(subject, str) else subject.decode()
+        sender = email_msg["From"]
+        to = email_msg["To"]
+        cc = email_msg["Cc"]
+        date = parser.parse(email_msg["Date"])
+
+        # Get body and attachments
+        body = ""
+        attachments = []
+
+        for part in email_msg.walk():
+            if part.get_content_type() == "text/plain":
+                body = part.get_payload(decode=True).decode()
+            elif part.get_content_maintype() != 'multipart':
+                payload = part.get_payload(decode=True)
+                if payload is None:
+                    continue
+                attachment = self._store_attachment(part.get_filename(), part.get_content_type(), payload)
+                if attachment is not None:
+                    attachments.append(attachment)
+
+        return EmailMessage(
+            subject=subject,
+            sender=sender,
+            to=to,
+            cc=cc,
+            date=date,
+            body=body,
+            attachments=attachments,
+            message_id=email_msg["Message-ID"],
+            provider="gmail",
+            headers={name: str(email_msg[name]) for name in self.extra_headers if email_msg[name] is not None},
+        )
+
+    def _load_sync_state(self) -> Dict[str, dict]:
+        """
+        Load the per-mailbox UIDVALIDITY / last UID watermarks.
+        """
+        if not self._sync_state_path.exists():
+            return {}
+        with open(self._sync_state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_sync_state(self, mailbox: str, uid_validity: int, last_uid: int) -> None:
+        """
+        Persist the watermark of a mailbox after a successful sync.
+        """
+        sync_state = self._load_sync_state()
+        sync_state[mailbox] = {"uidvalidity": uid_validity, "last_uid": last_uid}
+        safe_write_file(str(self._sync_state_path), json.dumps(sync_state, indent=2))
@@ -0,0 +1,97 @@
+from contextlib import contextmanager
+import imaplib
+import queue
+import threading
+from typing import Callable, Iterator, Optional
+
+from common.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Errors meaning the connection is no longer usable and should be replaced
+IMAP_DISCONNECT_ERRORS = (imaplib.IMAP4.abort, OSError)
+
+
+class ImapConnectionPool:
+    """
+    A small thread-safe pool of authenticated IMAP connections.
+
+    Connections are opened lazily up to `size`. A connection that fails with a disconnect error
+    is dropped from the pool, so the next acquirer opens a fresh one.
+    """
+
+    def __init__(self, connect: Callable[[], imaplib.IMAP4], size: int = 1, initial: Optional[imaplib.IMAP4] = None):
+        """
+        Args:
+            connect: Factory returning a logged-in connection with the mailbox selected
+            size: Maximum number of open connections
+            initial: An already opened connection to seed the pool with
+        """
+        self.size = max(1, size)
+        self._connect = connect
+        self._idle: queue.LifoQueue[imaplib.IMAP4] = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+        if initial is not None:
+            self._idle.put(initial)
+            self._created = 1
+
+    @contextmanager
+    def connection(self) -> Iterator[imaplib.IMAP4]:
+        """Borrow a connection for the duration of the block."""
+        conn = self._acquire()
+        try:
+            yield conn
+        except IMAP_DISCONNECT_ERRORS:
+            self._discard(conn)
+            raise
+        except Exception:
+            self._idle.put(conn)
+            raise
+        else:
+            self._idle.put(conn)
+
+    def close(self) -> None:
+        """Log out all idle connections."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._logout(conn)
+            with self._lock:
+                self._created -= 1
+
+    def _acquire(self) -> imaplib.IMAP4:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+
+        if not can_create:
+            return self._idle.get()
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _discard(self, conn: imaplib.IMAP4) -> None:
+        self._logout(conn)
+        with self._lock:
+            self._created -= 1
+
+    @staticmethod
+    def _logout(conn: imaplib.IMAP4) -> None:
+        try:
+            conn.logout()
+        except Exception as e:
+            logger.debug(f"Ignoring error while logging out IMAP connection: {str(e)}")
@@ -0,0 +1,196 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from common.logger import get_logger
+from llm.schemas.base import LLMResponse
+
+logger = get_logger(__name__)
+
+
+class LLMResponseCache:
+    """Two-tier cache of raw LLM responses keyed by the content of the request.
+
+    Lookups hit an in-memory LRU first, then an optional SQLite store that survives across runs.
+    Entries expire after `ttl_seconds`. Once `max_entries` is exceeded, the least recently used entries of the
+    SQLite store are evicted down to `evict_to_ratio` of it, so the eviction queries run once per batch of writes.
+    """
+
+    # Expired entries are deleted from the SQLite store at least once every this many writes
+    EXPIRE_INTERVAL = 1000
+    # Access times of hits are written to the SQLite store in batches of this many
+    TOUCH_BATCH = 100
+
+    def __init__(self,
+                 path: Optional[str] = None,
+                 memory_size: int = 1024,
+                 max_entries: int = 100_000,
+                 ttl_seconds: Optional[int] = 30 * 24 * 3600,
+                 evict_to_ratio: float = 0.9):
+        """Initialize the cache.
+
+        Args:
+            path: Path of the SQLite database file. If not provided, only the in-memory tier is used
+            memory_size: Maximum number of responses kept in the in-memory LRU
+            max_entries: Maximum number of responses kept in the SQLite store
+            ttl_seconds: Lifetime of a response. None keeps responses until evicted by size
+            evict_to_ratio: Fraction of `max_entries` the SQLite store is shrunk to when it is full
+        """
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evict_to_ratio = evict_to_ratio
+        self.hits = 0
+        self.misses = 0
+        # Key -> (creation time, response)
+        self._memory: OrderedDict[str, Tuple[float, LLMResponse]] = OrderedDict()
+        # Upper bound of the number of rows in the SQLite store, exact after each eviction
+        self._count = 0
+        self._writes_since_evict = 0
+        # Key -> access time of hits not yet written to the SQLite store
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+        if path is not None:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_response (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_response_accessed_at ON llm_response (accessed_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_response_created_at ON llm_response (created_at)")
+            self._conn.commit()
+            self._evict()
+
+    @staticmethod
+    def make_key(model: Optional[str],
+                 system_message: str,
+                 user_message: str,
+                 temperature: float,
+                 output_model: Type[BaseModel]) -> str:
+        """Hash the request fields that determine the response into a cache key."""
+        payload = json.dumps([
+            model,
+            system_message,
+            user_message,
+            temperature,
+            f"{output_model.__module__}.{output_model.__qualname__}",
+        ], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[LLMResponse]:
+        """Look up a cached response, promoting persisted hits into memory."""
+        with self._lock:
+            now = time.time()
+            entry = self._memory.get(key)
+            if entry is not None and self._is_expired(entry[0], now):
+                del self._memory[key]
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._touch(key, now)
+                self.hits += 1
+                return entry[1]
+
+            if self._conn is not None:
+                row = self._conn.execute("SELECT response, created_at FROM llm_response WHERE key = ?", (key,)).fetchone()
+                if row is not None and not self._is_expired(row[1], now):
+                    response = LLMResponse.model_validate_json(row[0])
+                    self._remember(key, response, row[1])
+                    self._touch(key, now)
+                    self.hits += 1
+                    return response
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, response: LLMResponse) -> None:
+        """Store a response in both tiers."""
+        with self._lock:
+            now = time.time()
+            self._remember(key, response, now)
+
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_response (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, response.model_dump_json(), now, now)
+                )
+                self._conn.commit()
+                self._count += 1
+                self._writes_since_evict += 1
+                if self._count > self.max_entries or self._writes_since_evict >= self.EXPIRE_INTERVAL:
+                    self._evict()
+
+    def stats(self) -> dict:
+        """Return hit/miss counters of this cache instance."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self) -> None:
+        if self._conn is not None:
+            with self._lock:
+                self._flush_touches()
+            self._conn.close()
+            self._conn = None
+
+    def _remember(self, key: str, response: LLMResponse, created_at: float) -> None:
+        self._memory[key] = (created_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _touch(self, key: str, now: float) -> None:
+        """Record a hit, so the entry looks recently used to the eviction of the SQLite store."""
+        if self._conn is None:
+            return
+        self._touched[key] = now
+        if len(self._touched) >= self.TOUCH_BATCH:
+            self._flush_touches()
+
+    def _flush_touches(self) -> None:
+        if not self._touched:
+            return
+        self._conn.executemany("UPDATE llm_response SET accessed_at = ? WHERE key = ?",
+                               [(accessed_at, key) for key, accessed_at in self._touched.items()])
+        self._conn.commit()
+        self._touched = {}
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _evict(self) -> None:
+        """Drop expired entries, then the least recently used ones down to `evict_to_ratio` of `max_entries` if it is exceeded."""
+        self._flush_touches()
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM llm_response WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_response").fetchone()
+        if count > self.max_entries:
+            target = int(self.max_entries * self.evict_to_ratio)
+            self._conn.execute(
+                "DELETE FROM llm_response WHERE key IN (SELECT key FROM llm_response ORDER BY accessed_at ASC LIMIT ?)",
+                (count - target,)
+            )
+            logger.debug(f"Evicted {count - target} cached LLM responses")
+            count = target
+        self._conn.commit()
+        self._count = count
+        self._writes_since_evict = 0
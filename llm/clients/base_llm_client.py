@@ -1,23 +1,51 @@
 from abc import abstractmethod
+import asyncio
+from contextlib import contextmanager
+from dataclasses import dataclass
 import logging
+import os
+import threading
 from colorama import Fore, Style
-from typing import Optional, TypeVar
+from typing import Any, Callable, Dict, Iterator, Optional, Set, Tuple, Type, TypeVar
 import json
-from pydantic import BaseModel
-import pystache
+from pydantic import BaseModel, ValidationError
 import time
 from common.logger import get_logger
+from llm.cache import LLMResponseCache
+from llm.json_stream import JsonItemStream, item_model
+from llm.metrics import LLMMetrics
 from llm.schemas.base import LLMRequest, LLMResponse, LLMTemplate
 import uuid
 
 from llm.templates.default import DefaultTemplate
 
 logger = get_logger(__name__)
-logger.setLevel(logging.DEBUG)
 
 T = TypeVar('T', bound=BaseModel)
 
 
+def _truncate_for_log(text: str) -> str:
+    """Shorten a prompt or response body to LLM_LOG_MAX_CHARS characters (default 2000, 0 for no limit)."""
+    max_chars = int(os.getenv("LLM_LOG_MAX_CHARS") or 2000)
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... [{len(text) - max_chars} more chars]"
+
+
+@dataclass
+class _PromptRun:
+    """State of a prompt between its preparation and its metrics record."""
+    request_id: str
+    template_name: str
+    llm_input: LLMRequest
+    OutputModel: Type[BaseModel]
+    ts: float
+    cache_key: Optional[str] = None
+    llm_response: Optional[LLMResponse] = None
+    cache_hit: bool = False
+    outcome: str = "error"
+
+
 class BaseLLMClient():
     """Base class for LLM clients that handles prompting and response parsing.
 
@@ -25,6 +53,26 @@ class BaseLLMClient():
     handling template rendering, logging, and response parsing.
     """
 
+    default_model: Optional[str] = None
+
+    def __init__(self,
+                 max_concurrency: int = 4,
+                 cache: Optional[LLMResponseCache] = None,
+                 metrics: Optional[LLMMetrics] = None):
+        """Initialize shared client state.
+
+        Args:
+            max_concurrency: Maximum number of in-flight requests issued through `aprompt`
+            cache: Optional response cache consulted before sending a request to the LLM
+            metrics: Optional metrics every request is recorded to
+        """
+        self.max_concurrency = max_concurrency
+        self.cache = cache
+        self.metrics = metrics
+        self._loop_resources: Dict[Tuple[str, asyncio.AbstractEventLoop], Any] = {}
+        self._loop_resources_lock = threading.Lock()
+        self._closing: Set[asyncio.Task] = set()
+
     @abstractmethod
     def _request(self, prompt_input: LLMRequest) -> LLMResponse:
         """Send a request to the LLM and get the raw response.
@@ -37,6 +85,88 @@ class BaseLLMClient():
         """
         pass
 
+    async def _arequest(self, prompt_input: LLMRequest) -> LLMResponse:
+        """Send a request to the LLM asynchronously.
+
+        Clients without a native async transport fall back to running `_request` in a worker thread.
+
+        Args:
+            prompt_input (LLMRequest): The formatted request containing user and system messages
+
+        Returns:
+            LLMResponse: The raw response from the LLM
+        """
+        return await asyncio.to_thread(self._request, prompt_input)
+
+    def _request_stream(self, prompt_input: LLMRequest, on_chunk: Callable[[str], None]) -> LLMResponse:
+        """Send a request to the LLM, passing the response text to `on_chunk` as it is generated.
+
+        Clients without streaming support pass the whole response as a single chunk.
+        If the stream breaks, `on_chunk` has received everything generated until then.
+
+        Args:
+            prompt_input (LLMRequest): The formatted request containing user and system messages
+            on_chunk (Callable[[str], None]): Called with each piece of the response text
+
+        Returns:
+            LLMResponse: The complete raw response from the LLM
+        """
+        llm_response = self._request(prompt_input)
+        on_chunk(llm_response.response_str)
+        return llm_response
+
+    async def _arequest_stream(self, prompt_input: LLMRequest, on_chunk: Callable[[str], None]) -> LLMResponse:
+        """Asynchronous counterpart of `_request_stream`."""
+        llm_response = await self._arequest(prompt_input)
+        on_chunk(llm_response.response_str)
+        return llm_response
+
+    def _loop_resource(self, name: str, factory: Callable[[], Any]) -> Any:
+        """Get an object bound to the running event loop, creating it on first use in that loop.
+
+        Async primitives and async HTTP clients cannot be shared across event loops,
+        so one is kept per loop, and those of loops that have since closed are closed and released.
+        """
+        loop = asyncio.get_running_loop()
+        with self._loop_resources_lock:
+            resource = self._loop_resources.get((name, loop))
+            if resource is not None:
+                return resource
+            resource = factory()
+            self._loop_resources[(name, loop)] = resource
+            stale = [key for key in self._loop_resources if key[1].is_closed()]
+            stale_resources = [self._loop_resources.pop(key) for key in stale]
+
+        for stale_resource in stale_resources:
+            self._close_resource(stale_resource)
+        return resource
+
+    def _close_resource(self, resource: Any) -> None:
+        """Close a resource of a closed event loop from the running loop, ignoring failures of its dead connections."""
+        # The Ollama AsyncClient has no close method of its own, its HTTP client is closed instead
+        close = getattr(resource, "aclose", None) or getattr(resource, "close", None) \
+            or getattr(getattr(resource, "_client", None), "aclose", None)
+        if close is None:
+            return
+        try:
+            result = close()
+        except Exception as e:
+            logger.debug(f"Failed to close {type(resource).__name__}: {str(e)}")
+            return
+        if not asyncio.iscoroutine(result):
+            return
+
+        async def await_close():
+            try:
+                await result
+            except Exception as e:
+                logger.debug(f"Failed to close {type(resource).__name__}: {str(e)}")
+
+        # Keep a reference, so the task is not garbage collected before it completes
+        task = asyncio.get_running_loop().create_task(await_close())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
     def prompt(self,
                user_message: Optional[str] = None,
                template: Optional[LLMTemplate[T]] = None,
@@ -55,38 +185,230 @@ class BaseLLMClient():
         Raises:
             Exception: If template rendering or response parsing fails
         """
+        with self._prompt_run(user_message, template, template_params) as run:
+            if run.llm_response is None:
+                run.llm_response = self._request(run.llm_input)
+            return self._finish_prompt(run)
+
+    async def aprompt(self,
+                      user_message: Optional[str] = None,
+                      template: Optional[LLMTemplate[T]] = None,
+                      template_params: Optional[dict] = None
+                      ) -> T:
+        """Asynchronous counterpart of `prompt`.
+
+        At most `max_concurrency` requests are in flight at once per event loop,
+        so callers can freely `asyncio.gather` independent prompts.
+
+        Args:
+            user_message (Optional[str]): Direct message to send to LLM if no template is used
+            template (Optional[LLMTemplate]): Template containing system and user message templates
+            template_params (Optional[dict]): Parameters to render into the template
+
+        Returns:
+            T: Parsed response matching the template's output model
+        """
+        with self._prompt_run(user_message, template, template_params) as run:
+            if run.llm_response is None:
+                async with self._semaphore():
+                    run.llm_response = await self._arequest(run.llm_input)
+            return self._finish_prompt(run)
+
+    def prompt_items(self,
+                     template: LLMTemplate[T],
+                     template_params: Optional[dict] = None,
+                     items_field: str = "emails"
+                     ) -> Tuple[T, bool]:
+        """Process a batched prompt whose output is a list of items, salvaging what it can from bad responses.
+
+        The response is streamed and its `items_field` items are parsed and validated as they arrive.
+        When the response is truncated, malformed, or the stream breaks, the output holds the valid items
+        received so far instead of raising, so callers can re-request only the missing ones.
+
+        Args:
+            template (LLMTemplate): Template whose output model has a list of models under `items_field`
+            template_params (Optional[dict]): Parameters to render into the template
+            items_field (str): Name of the list field of the output model
+
+        Returns:
+            Tuple[T, bool]: The output, and whether the response was complete.
+                An incomplete output only holds the salvaged items, its other fields are unset.
+        """
+        with self._prompt_run(None, template, template_params) as run:
+            item_stream = JsonItemStream(items_field, item_model(run.OutputModel, items_field))
+            if run.llm_response is None:
+                try:
+                    run.llm_response = self._request_stream(run.llm_input, item_stream.feed)
+                except Exception as e:
+                    self._stream_failed(run, item_stream, e)
+            return self._finish_items(run, item_stream)
+
+    async def aprompt_items(self,
+                            template: LLMTemplate[T],
+                            template_params: Optional[dict] = None,
+                            items_field: str = "emails"
+                            ) -> Tuple[T, bool]:
+        """Asynchronous counterpart of `prompt_items`, limited to `max_concurrency` requests in flight like `aprompt`."""
+        with self._prompt_run(None, template, template_params) as run:
+            item_stream = JsonItemStream(items_field, item_model(run.OutputModel, items_field))
+            if run.llm_response is None:
+                try:
+                    async with self._semaphore():
+                        run.llm_response = await self._arequest_stream(run.llm_input, item_stream.feed)
+                except Exception as e:
+                    self._stream_failed(run, item_stream, e)
+            return self._finish_items(run, item_stream)
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        """Semaphore limiting the requests in flight in the running event loop to `max_concurrency`."""
+        return self._loop_resource("semaphore", lambda: asyncio.Semaphore(self.max_concurrency))
+
+    @contextmanager
+    def _prompt_run(self,
+                    user_message: Optional[str],
+                    template: Optional[LLMTemplate[T]],
+                    template_params: Optional[dict]
+                    ) -> Iterator[_PromptRun]:
+        """Prepare a prompt and look up its cached response, then log its failure and record its metrics once done.
+
+        Only the transport differs between the prompt methods: they send the request when no cached response
+        was found, and finish the run with `_finish_prompt` or `_finish_items`.
+        """
+        request_id, template_name, llm_input, OutputModel = self._prepare_request(user_message, template, template_params)
+        run = _PromptRun(request_id=request_id, template_name=template_name, llm_input=llm_input, OutputModel=OutputModel, ts=time.time())
+        try:
+            run.cache_key, run.llm_response = self._lookup_cache(llm_input, OutputModel)
+            run.cache_hit = run.llm_response is not None
+            yield run
+        except Exception as e:
+            logger.error(f"An error occurred: {str(e)}")
+            raise
+        finally:
+            self._record_metrics(run)
+
+    def _finish_prompt(self, run: _PromptRun) -> T:
+        """Parse the response of a prompt, caching it once it parsed."""
+        try:
+            result = self._parse_response(run.request_id, run.template_name, run.llm_response, int((time.time() - run.ts) * 1000), run.OutputModel)
+        except (json.JSONDecodeError, ValidationError):
+            run.outcome = "parse_failure"
+            raise
+        self._store_cache(run.cache_key, run.llm_response)
+        run.outcome = "ok"
+        return result
+
+    def _finish_items(self, run: _PromptRun, item_stream: JsonItemStream) -> Tuple[T, bool]:
+        """Parse the response of an item prompt, falling back to the salvaged items. Only complete responses are cached."""
+        result, complete = self._parse_items(run.request_id, run.template_name, run.llm_response, run.ts, run.OutputModel, item_stream)
+        if complete:
+            self._store_cache(run.cache_key, run.llm_response)
+        run.outcome = "ok" if complete else "parse_failure"
+        return result, complete
+
+    @staticmethod
+    def _stream_failed(run: _PromptRun, item_stream: JsonItemStream, error: Exception) -> None:
+        """Handle a broken response stream: raise if nothing was salvaged, else keep the items received."""
+        if not item_stream.items:
+            raise error
+        logger.warning(f"<{run.request_id}> [{run.template_name}] Response stream failed after {len(item_stream.items)} items: {str(error)}")
+
+    def _prepare_request(self,
+                         user_message: Optional[str],
+                         template: Optional[LLMTemplate[T]],
+                         template_params: Optional[dict]
+                         ) -> Tuple[str, str, LLMRequest, Type[T]]:
+        """Render the template and build the LLM request."""
         request_id = str(uuid.uuid4()).split('-')[0]
 
         if template is not None:
-            user_message = pystache.render(template.user_message, template_params)
-            system_message = pystache.render(template.system_message, template_params)
+            system_message, user_message = template.render(template_params)
             OutputModel = template.output_model
         else:
             user_message = user_message
             system_message = DefaultTemplate.system_message
             OutputModel = DefaultTemplate.output_model
 
-        template_name = template.__class__.__name__ if template is not None else 'N/A'
-        try:
+        template_name = template.name if template is not None else DefaultTemplate.name
+
+        # Prompts can be several kilobytes, only serialize them when debug output is enabled
+        if logger.isEnabledFor(logging.DEBUG):
             logger.debug(f"{Fore.GREEN}<{request_id}> [{template_name}] System Message: {
-                         json.dumps(system_message)}{Style.RESET_ALL}")
+                         json.dumps(_truncate_for_log(system_message))}{Style.RESET_ALL}")
             logger.debug(f"{Fore.GREEN}<{request_id}> [{template_name}] User Message: {
-                         json.dumps(user_message)}{Style.RESET_ALL}")
+                         json.dumps(_truncate_for_log(user_message))}{Style.RESET_ALL}")
+
+        llm_input = LLMRequest(user_message=user_message, system_message=system_message, temperature=0.01, max_tokens=8192,
+                               template_name=template_name)
+        return request_id, template_name, llm_input, OutputModel
+
+    def _lookup_cache(self, llm_input: LLMRequest, OutputModel: Type[T]) -> Tuple[Optional[str], Optional[LLMResponse]]:
+        """Return the cache key of the request and the cached response, if any."""
+        if self.cache is None:
+            return None, None
+        cache_key = LLMResponseCache.make_key(
+            model=llm_input.model or self.default_model,
+            system_message=llm_input.system_message,
+            user_message=llm_input.user_message,
+            temperature=llm_input.temperature,
+            output_model=OutputModel,
+        )
+        return cache_key, self.cache.get(cache_key)
+
+    def _store_cache(self, cache_key: Optional[str], llm_response: LLMResponse) -> None:
+        """Cache a response once it has been parsed successfully."""
+        if self.cache is not None:
+            self.cache.set(cache_key, llm_response)
+
+    def _record_metrics(self, run: _PromptRun) -> None:
+        """Record a finished request to the metrics, if any. Cached responses consumed no tokens."""
+        if self.metrics is None:
+            return
+        token_usage = run.llm_response.token_usage if run.llm_response is not None and not run.cache_hit else None
+        self.metrics.record(
+            request_id=run.request_id,
+            template=run.template_name,
+            model=run.llm_input.model or self.default_model,
+            latency_ms=int((time.time() - run.ts) * 1000),
+            input_tokens=token_usage.input_token if token_usage is not None else 0,
+            output_tokens=token_usage.output_token if token_usage is not None else 0,
+            cached_input_tokens=token_usage.cached_input_token if token_usage is not None else 0,
+            cache_hit=run.cache_hit,
+            outcome=run.outcome,
+        )
 
-            llm_input = LLMRequest(user_message=user_message, system_message=system_message, temperature=0.01, max_tokens=8192)
-            ts = time.time()
-            llm_response = self._request(llm_input)
-            time_used_ms = int((time.time() - ts) * 1000)
+    def _parse_items(self,
+                     request_id: str,
+                     template_name: str,
+                     llm_response: Optional[LLMResponse],
+                     ts: float,
+                     OutputModel: Type[T],
+                     item_stream: JsonItemStream
+                     ) -> Tuple[T, bool]:
+        """Parse a complete response, falling back to the items salvaged by the stream parser."""
+        if llm_response is not None:
+            try:
+                return self._parse_response(request_id, template_name, llm_response, int((time.time() - ts) * 1000), OutputModel), True
+            except (json.JSONDecodeError, ValidationError) as e:
+                logger.warning(f"<{request_id}> [{template_name}] Invalid response, salvaged {len(item_stream.items)} items: {str(e)}")
+        return OutputModel.model_construct(**{item_stream.items_field: item_stream.items}), False
+
+    def _parse_response(self,
+                        request_id: str,
+                        template_name: str,
+                        llm_response: LLMResponse,
+                        time_used_ms: int,
+                        OutputModel: Type[T]
+                        ) -> T:
+        """Parse the raw LLM response into the output model."""
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        if debug_enabled:
             logger.debug(f"{Fore.BLUE}<{request_id}> [{template_name}] Response ({time_used_ms}ms): {
-                         str(llm_response.response_str)}{Style.RESET_ALL}")
+                         _truncate_for_log(llm_response.response_str)}{Style.RESET_ALL}")
 
-            response_dict = json.loads(llm_response.response_str)
+        response_dict = json.loads(llm_response.response_str)
 
+        if debug_enabled:
             logger.debug(f"{Fore.YELLOW}<{request_id}> [{template_name}] Response Parsed:\n{
-                json.dumps(response_dict, indent=2)}{Fore.RESET}")
-
-            return OutputModel(**response_dict)
+                _truncate_for_log(json.dumps(response_dict, indent=2))}{Fore.RESET}")
 
-        except Exception as e:
-            logger.error(f"An error occurred: {str(e)}")
-            raise e
+        return OutputModel(**response_dict)
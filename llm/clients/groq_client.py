@@ -1,7 +1,14 @@
-from typing import Optional
-from groq import Groq
+import asyncio
+import random
+import time
+from typing import Callable, Optional
+from groq import APIConnectionError, APIStatusError, AsyncGroq, Groq, RateLimitError
+from llm.cache import LLMResponseCache
+from llm.metrics import LLMMetrics
 from llm.clients.base_llm_client import BaseLLMClient
+from llm.rate_limiter import RateLimiter, parse_duration
 from llm.schemas.base import LLMRequest, LLMResponse, LLMTokenUsage
+from llm.token_budget import estimate_tokens
 from common.logger import get_logger
 
 logger = get_logger(__name__)
@@ -12,16 +19,35 @@ class GroqClient(BaseLLMClient):
     client: Groq
     default_model: str
 
-    def __init__(self, api_key: str, default_model: Optional[str] = None):
+    def __init__(self, api_key: str, default_model: Optional[str] = None, max_concurrency: int = 4, cache: Optional[LLMResponseCache] = None,
+                 metrics: Optional[LLMMetrics] = None, rate_limiter: Optional[RateLimiter] = None, max_retries: int = 6,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0):
         """Initialize Groq client with optional API key configuration.
 
+        Requests are paced by a rate limiter fed with Groq's rate-limit headers, and rate-limited (429),
+        server error (5xx) and connection failures are retried with jittered exponential backoff.
+        Groq's JSON mode does not support streaming, so streamed prompts fall back to a single request.
+
         Args:
             api_key: Groq API key. If not provided, will look for GROQ_API_KEY environment variable
             default_model: Optional default model to use. If not provided, uses mixtral-8x7b-32768
+            max_concurrency: Maximum number of concurrent requests issued through `aprompt`
+            cache: Optional response cache consulted before sending a request
+            metrics: Optional metrics every request is recorded to
+            rate_limiter: Limiter pacing the requests. If not provided, quotas are learned from the response headers
+            max_retries: Maximum number of retries of a failed request
+            backoff_base: Backoff of the first retry in seconds, doubled on every further retry
+            backoff_max: Maximum backoff in seconds
         """
-        super().__init__()
-        self.client = Groq(api_key=api_key)
+        super().__init__(max_concurrency=max_concurrency, cache=cache, metrics=metrics)
+        self.api_key = api_key
+        # Retries are handled here, so they are paced and recorded
+        self.client = Groq(api_key=api_key, max_retries=0)
         self.default_model = default_model or "llama-3.1-8b-instant"
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
 
     def _request(self, prompt_input: LLMRequest) -> LLMResponse:
         """Execute request to Groq API.
@@ -32,34 +58,134 @@ class GroqClient(BaseLLMClient):
         Returns:
             LLMResponse with the model's response and token usage
         """
-        try:
-            # Make the API call
-            response = self.client.chat.completions.create(
-                model=prompt_input.model or self.default_model,
-                messages=[{
-                    "role": "system",
-                    "content": prompt_input.system_message
-                }, {
-                    "role": "user",
-                    "content": prompt_input.user_message
-                }],
-                response_format={
-                    "type": "json_object"
-                }
-            )
-
-            # Extract response and token usage
-            completion = response.choices[0].message.content
-            token_usage = LLMTokenUsage(
-                input_token=response.usage.prompt_tokens,
-                output_token=response.usage.completion_tokens
-            )
-
-            return LLMResponse(
-                response_str=completion,
-                token_usage=token_usage
-            )
-
-        except Exception as e:
-            logger.error(f"Error making request to Groq API: {str(e)}")
-            raise
+        raw_response = self._send(prompt_input, lambda: self.client.chat.completions.with_raw_response.create(
+            **self._completion_params(prompt_input)))
+        return self._to_llm_response(raw_response.parse())
+
+    async def _arequest(self, prompt_input: LLMRequest) -> LLMResponse:
+        """Execute request to Groq API asynchronously.
+
+        Args:
+            prompt_input: LLMRequest containing the prompt configuration
+
+        Returns:
+            LLMResponse with the model's response and token usage
+        """
+        async_client = self._async_client()
+        raw_response = await self._asend(prompt_input, lambda: async_client.chat.completions.with_raw_response.create(
+            **self._completion_params(prompt_input)))
+        return self._to_llm_response(await raw_response.parse())
+
+    def _async_client(self) -> AsyncGroq:
+        return self._loop_resource("async_client", lambda: AsyncGroq(api_key=self.api_key, max_retries=0))
+
+    def _send(self, prompt_input: LLMRequest, create: Callable):
+        """Send a request once the rate limiter allows it, retrying retryable failures.
+
+        Returns:
+            The raw response, whose headers have been fed to the rate limiter
+        """
+        attempt = 0
+        while True:
+            delay = self.rate_limiter.reserve(self._estimate_cost(prompt_input))
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                raw_response = create()
+            except Exception as e:
+                delay = self._retry_delay(prompt_input, e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.rate_limiter.update(raw_response.headers)
+            return raw_response
+
+    async def _asend(self, prompt_input: LLMRequest, create: Callable):
+        """Asynchronous counterpart of `_send`, `create` returning an awaitable."""
+        attempt = 0
+        while True:
+            delay = self.rate_limiter.reserve(self._estimate_cost(prompt_input))
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                raw_response = await create()
+            except Exception as e:
+                delay = self._retry_delay(prompt_input, e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.rate_limiter.update(raw_response.headers)
+            return raw_response
+
+    def _retry_delay(self, prompt_input: LLMRequest, error: Exception, attempt: int) -> Optional[float]:
+        """Backoff before retrying a failed request, None if it should not be retried.
+
+        The backoff is drawn uniformly up to `backoff_base * 2^attempt` (capped by `backoff_max`), so concurrent
+        requests do not retry in lockstep. A rate-limited request waits at least the `retry-after` of the response,
+        and holds back every other request for as long.
+        """
+        retryable = isinstance(error, (RateLimitError, APIConnectionError)) or (
+            isinstance(error, APIStatusError) and error.status_code >= 500)
+        if not retryable or attempt >= self.max_retries:
+            logger.error(f"Error making request to Groq API: {str(error)}")
+            return None
+
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if isinstance(error, APIStatusError):
+            self.rate_limiter.update(error.response.headers)
+            retry_after = parse_duration(error.response.headers.get("retry-after"))
+            if retry_after is not None:
+                delay += retry_after
+            if isinstance(error, RateLimitError):
+                self.rate_limiter.block(delay)
+
+        logger.warning(f"[{prompt_input.template_name}] Groq request failed ({str(error)}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        if self.metrics is not None:
+            self.metrics.record_retry(prompt_input.template_name or "unknown", prompt_input.model or self.default_model)
+        return delay
+
+    @staticmethod
+    def _estimate_cost(prompt_input: LLMRequest) -> int:
+        """Estimated tokens a request counts against the quota, before the actual usage is known."""
+        return estimate_tokens(prompt_input.system_message + prompt_input.user_message)
+
+    def _completion_params(self, prompt_input: LLMRequest) -> dict:
+        """Build chat completion arguments from the request."""
+        return {
+            "model": prompt_input.model or self.default_model,
+            "messages": [{
+                "role": "system",
+                "content": prompt_input.system_message
+            }, {
+                "role": "user",
+                "content": prompt_input.user_message
+            }],
+            "response_format": {
+                "type": "json_object"
+            }
+        }
+
+    def _to_llm_response(self, response) -> LLMResponse:
+        """Extract response and token usage from a chat completion."""
+        completion = response.choices[0].message.content
+
+        return LLMResponse(
+            response_str=completion,
+            token_usage=self._token_usage(response.usage)
+        )
+
+    @staticmethod
+    def _token_usage(usage) -> LLMTokenUsage:
+        """Token counts of a completion, including the prompt tokens Groq served from its prompt cache."""
+        if usage is None:
+            return LLMTokenUsage(input_token=0, output_token=0)
+        prompt_details = getattr(usage, "prompt_tokens_details", None)
+        return LLMTokenUsage(
+            input_token=usage.prompt_tokens,
+            output_token=usage.completion_tokens,
+            cached_input_token=(getattr(prompt_details, "cached_tokens", None) or 0) if prompt_details is not None else 0,
+        )
@@ -1,5 +1,9 @@
-from typing import Optional
-from ollama import Client
+import hashlib
+import threading
+from typing import Callable, Dict, Optional, Tuple, Union
+from ollama import AsyncClient, Client
+from llm.cache import LLMResponseCache
+from llm.metrics import LLMMetrics
 from llm.clients.base_llm_client import BaseLLMClient
 from llm.schemas.base import LLMRequest, LLMResponse, LLMTokenUsage
 from common.logger import get_logger
@@ -12,14 +16,31 @@ class OllamaClient(BaseLLMClient):
     client: Client
     default_model: str
 
-    def __init__(self, host: Optional[str] = None, default_model: Optional[str] = None):
+    def __init__(self, host: Optional[str] = None, default_model: Optional[str] = None, max_concurrency: int = 4, cache: Optional[LLMResponseCache] = None,
+                 metrics: Optional[LLMMetrics] = None, keep_alive: Optional[Union[str, float]] = "30m", reuse_tolerance: float = 0.2):
         """Initialize Ollama client with optional host configuration.
 
+        Ollama reuses the evaluated KV cache of the longest prompt prefix shared with the previous request,
+        so templates keep their stable parts (instructions, persona) in the system message, ahead of the
+        per-request content. `keep_alive` keeps the model and that cache loaded between requests.
+
         Args:
             host: Optional host URL for Ollama server (e.g., 'http://localhost:11434')
+            max_concurrency: Maximum number of concurrent requests issued through `aprompt`
+            cache: Optional response cache consulted before sending a request
+            metrics: Optional metrics every request is recorded to
+            keep_alive: How long the model stays loaded after a request, e.g. "30m" or seconds. None uses the server default
+            reuse_tolerance: Fraction below the smallest full evaluation of a system message under which a request
+                is reported to have reused the KV cache
         """
-        super().__init__()
-        self.client = Client(host=host or "http://localhost:11434")
+        super().__init__(max_concurrency=max_concurrency, cache=cache, metrics=metrics)
+        self.host = host or "http://localhost:11434"
+        self.keep_alive = keep_alive
+        self.client = Client(host=self.host)
+        # (model, system message hash) -> smallest `prompt_eval_count` of the requests with it evaluated in full
+        self._full_eval_counts: Dict[Tuple[str, str], int] = {}
+        self.reuse_tolerance = reuse_tolerance
+        self._prefix_lock = threading.Lock()
         if default_model:
             self.default_model = default_model
         else:
@@ -34,19 +55,97 @@ class OllamaClient(BaseLLMClient):
         Returns:
             LLMRawResponse with the model's response and token usage
         """
-        response = self.client.generate(
-            model=prompt_input.model or self.default_model,
-            prompt=prompt_input.user_message,
-            system=prompt_input.system_message,
-            format="json"
-        )
+        response = self.client.generate(**self._generate_params(prompt_input))
+
+        return self._to_llm_response(response, prompt_input)
+
+    async def _arequest(self, prompt_input: LLMRequest) -> LLMResponse:
+        """Execute request to Ollama server asynchronously.
+
+        Args:
+            prompt_input: LLMRequest containing the prompt configuration
+
+        Returns:
+            LLMResponse with the model's response and token usage
+        """
+        async_client: AsyncClient = self._loop_resource("async_client", lambda: AsyncClient(host=self.host))
+        response = await async_client.generate(**self._generate_params(prompt_input))
+
+        return self._to_llm_response(response, prompt_input)
 
-        token_usage = LLMTokenUsage(
-            input_token=response.get('prompt_eval_count', 0),
-            output_token=response.get('eval_count', 0)
+    def _request_stream(self, prompt_input: LLMRequest, on_chunk: Callable[[str], None]) -> LLMResponse:
+        """Execute a streamed request to Ollama server, passing response text to `on_chunk` as it is generated."""
+        chunks = []
+        final = None
+        for part in self.client.generate(**self._generate_params(prompt_input), stream=True):
+            chunks.append(part['response'])
+            on_chunk(part['response'])
+            final = part
+
+        return self._to_streamed_response("".join(chunks), final, prompt_input)
+
+    async def _arequest_stream(self, prompt_input: LLMRequest, on_chunk: Callable[[str], None]) -> LLMResponse:
+        """Execute a streamed request to Ollama server asynchronously."""
+        async_client: AsyncClient = self._loop_resource("async_client", lambda: AsyncClient(host=self.host))
+        chunks = []
+        final = None
+        async for part in await async_client.generate(**self._generate_params(prompt_input), stream=True):
+            chunks.append(part['response'])
+            on_chunk(part['response'])
+            final = part
+
+        return self._to_streamed_response("".join(chunks), final, prompt_input)
+
+    def _generate_params(self, prompt_input: LLMRequest) -> dict:
+        """Build generate arguments from the request."""
+        params = {
+            "model": prompt_input.model or self.default_model,
+            "prompt": prompt_input.user_message,
+            "system": prompt_input.system_message,
+            "format": "json",
+        }
+        if self.keep_alive is not None:
+            params["keep_alive"] = self.keep_alive
+        return params
+
+    def _to_streamed_response(self, response_str: str, final, prompt_input: LLMRequest) -> LLMResponse:
+        """Build LLMResponse from streamed text, the last part carrying the token counts."""
+        return LLMResponse(
+            response_str=response_str,
+            token_usage=self._token_usage(final or {}, prompt_input)
         )
 
+    def _to_llm_response(self, response, prompt_input: LLMRequest) -> LLMResponse:
+        """Convert an Ollama generate response into LLMResponse."""
         return LLMResponse(
             response_str=response['response'],
-            token_usage=token_usage
+            token_usage=self._token_usage(response, prompt_input)
         )
+
+    def _token_usage(self, response, prompt_input: LLMRequest) -> LLMTokenUsage:
+        """Token counts of a response.
+
+        Ollama does not report KV cache reuse, `prompt_eval_count` only counts the prompt tokens that were evaluated.
+        Reuse is only reported when a request evaluates more than `reuse_tolerance` fewer tokens than the smallest
+        fully evaluated request with the same system message, which differing user messages alone cannot explain.
+        The reported amount is then an estimate: the difference with that smallest full evaluation.
+        """
+        prompt_eval_count = response.get('prompt_eval_count') or 0
+        return LLMTokenUsage(
+            input_token=prompt_eval_count,
+            output_token=response.get('eval_count') or 0,
+            cached_input_token=self._estimate_reused_tokens(prompt_input, prompt_eval_count),
+        )
+
+    def _estimate_reused_tokens(self, prompt_input: LLMRequest, prompt_eval_count: int) -> int:
+        """Estimated number of prompt tokens reused from the KV cache, 0 when reuse is not detected."""
+        if not prompt_eval_count or not prompt_input.system_message:
+            return 0
+        key = (prompt_input.model or self.default_model, hashlib.sha256(prompt_input.system_message.encode('utf-8')).hexdigest())
+        with self._prefix_lock:
+            full_count = self._full_eval_counts.get(key)
+            if full_count is not None and prompt_eval_count < full_count * (1 - self.reuse_tolerance):
+                return full_count - prompt_eval_count
+            # No reuse detected, the request was evaluated in full
+            self._full_eval_counts[key] = prompt_eval_count if full_count is None else min(full_count, prompt_eval_count)
+            return 0
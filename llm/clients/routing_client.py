@@ -0,0 +1,265 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+import json
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional, Tuple, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+from common.logger import get_logger
+from llm.clients.base_llm_client import BaseLLMClient
+from llm.schemas.base import LLMRequest, LLMResponse, LLMTemplate
+from llm.templates.default import DefaultTemplate
+
+logger = get_logger(__name__)
+
+T = TypeVar('T', bound=BaseModel)
+
+
+def _template_name(template: Optional[LLMTemplate]) -> str:
+    return template.name if template is not None else DefaultTemplate.name
+
+
+def _is_backend_failure(error: BaseException) -> bool:
+    """Whether an error is the backend's fault. An unparsable response is not, and is not retried elsewhere."""
+    return not isinstance(error, (json.JSONDecodeError, ValidationError))
+
+
+@dataclass(eq=False)
+class LLMBackend:
+    """A client the router can send requests to, with its balancing state."""
+    name: str
+    client: BaseLLMClient
+    weight: float = 1.0
+    outstanding: int = 0
+    requests: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    down_until: float = 0.0
+    # Moving average of the latency of successful requests
+    latency_ms: Optional[float] = None
+    # Smooth weighted round-robin counter
+    current_weight: float = 0.0
+
+
+class RoutingLLMClient(BaseLLMClient):
+    """Client distributing prompts over several backends, e.g. multiple Ollama hosts and Groq.
+
+    Each prompt goes to the backend picked by the balancing strategy among those routed for its template,
+    and fails over to the next backend when the picked one errors or exceeds `timeout_seconds`.
+    A failing backend is skipped for a cooldown that doubles with every consecutive failure.
+    Prompts go through each backend's own prompt methods, so caching, metrics and concurrency limits are
+    handled by the backends, under the model that actually answered.
+    """
+
+    def __init__(self,
+                 backends: List[LLMBackend],
+                 routes: Optional[Dict[str, List[str]]] = None,
+                 strategy: Literal["least_outstanding", "weighted"] = "least_outstanding",
+                 timeout_seconds: Optional[float] = None,
+                 cooldown_seconds: float = 30,
+                 max_cooldown_seconds: float = 600):
+        """Initialize the router.
+
+        Args:
+            backends: Backends to distribute prompts over, each with its own cache and metrics
+            routes: Template name -> names of the backends preferred for it. Other backends are only used to fail over.
+                Templates without a route use every backend
+            strategy: "least_outstanding" sends to the backend with the fewest in-flight prompts relative to its weight,
+                "weighted" spreads prompts in proportion to the weights
+            timeout_seconds: Time after which a prompt fails over to the next backend. None to wait as long as needed.
+                Streamed item prompts are not timed out, as they report progress
+            cooldown_seconds: Time a failed backend is skipped for, doubled with every consecutive failure
+            max_cooldown_seconds: Maximum time a failed backend is skipped for
+        """
+        if not backends:
+            raise ValueError("RoutingLLMClient needs at least one backend")
+        names = [backend.name for backend in backends]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Backend names must be unique: {names}")
+        for template_name, route in (routes or {}).items():
+            unknown = set(route) - set(names)
+            if unknown:
+                raise ValueError(f"Route of {template_name} refers to unknown backends: {sorted(unknown)}")
+
+        super().__init__(max_concurrency=sum(backend.client.max_concurrency for backend in backends))
+        self.backends = backends
+        self.routes = routes or {}
+        self.strategy = strategy
+        self.timeout_seconds = timeout_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.max_cooldown_seconds = max_cooldown_seconds
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def prompt(self,
+               user_message: Optional[str] = None,
+               template: Optional[LLMTemplate[T]] = None,
+               template_params: Optional[dict] = None
+               ) -> T:
+        return self._route(_template_name(template), lambda client: client.prompt(
+            user_message=user_message, template=template, template_params=template_params))
+
+    async def aprompt(self,
+                      user_message: Optional[str] = None,
+                      template: Optional[LLMTemplate[T]] = None,
+                      template_params: Optional[dict] = None
+                      ) -> T:
+        return await self._aroute(_template_name(template), lambda client: client.aprompt(
+            user_message=user_message, template=template, template_params=template_params))
+
+    def prompt_items(self,
+                     template: LLMTemplate[T],
+                     template_params: Optional[dict] = None,
+                     items_field: str = "emails"
+                     ) -> Tuple[T, bool]:
+        """Route a batched item prompt. It only fails over when the backend salvaged no item at all."""
+        return self._route(template.name, lambda client: client.prompt_items(
+            template=template, template_params=template_params, items_field=items_field), timeout=False)
+
+    async def aprompt_items(self,
+                            template: LLMTemplate[T],
+                            template_params: Optional[dict] = None,
+                            items_field: str = "emails"
+                            ) -> Tuple[T, bool]:
+        return await self._aroute(template.name, lambda client: client.aprompt_items(
+            template=template, template_params=template_params, items_field=items_field), timeout=False)
+
+    def _request(self, prompt_input: LLMRequest) -> LLMResponse:
+        raise NotImplementedError("RoutingLLMClient sends prompts through the prompt methods of its backends")
+
+    def _route(self, template_name: str, call: Callable[[BaseLLMClient], Any], timeout: bool = True) -> Any:
+        """Call the backends in the planned order until one succeeds."""
+        last_error: Optional[Exception] = None
+        for backend in self._plan(template_name):
+            ts = self._start(backend)
+            if not timeout or self.timeout_seconds is None:
+                try:
+                    result = call(backend.client)
+                except Exception as e:
+                    self._finish(backend, ts, e)
+                    if not _is_backend_failure(e):
+                        raise
+                    last_error = e
+                    continue
+                self._finish(backend, ts, None)
+                return result
+
+            # Run on a worker so a slow backend can be left behind, its prompt still counts as outstanding until it ends
+            timed_out = threading.Event()
+            future = self._get_executor().submit(call, backend.client)
+            future.add_done_callback(lambda f, backend=backend, ts=ts, timed_out=timed_out: self._finish(
+                backend, ts, f.exception(), failure_recorded=timed_out.is_set()))
+            try:
+                return future.result(timeout=self.timeout_seconds)
+            except FutureTimeoutError:
+                timed_out.set()
+                last_error = TimeoutError(f"No response from {backend.name} within {self.timeout_seconds}s")
+                self._mark_failed(backend, last_error)
+            except Exception as e:
+                if not _is_backend_failure(e):
+                    raise
+                last_error = e
+        raise last_error
+
+    async def _aroute(self, template_name: str, call: Callable[[BaseLLMClient], Awaitable[Any]], timeout: bool = True) -> Any:
+        """Asynchronous counterpart of `_route`."""
+        last_error: Optional[Exception] = None
+        for backend in self._plan(template_name):
+            ts = self._start(backend)
+            try:
+                result = await asyncio.wait_for(call(backend.client), timeout=self.timeout_seconds if timeout else None)
+            except asyncio.TimeoutError:
+                last_error = TimeoutError(f"No response from {backend.name} within {self.timeout_seconds}s")
+                self._finish(backend, ts, last_error)
+                continue
+            except Exception as e:
+                self._finish(backend, ts, e)
+                if not _is_backend_failure(e):
+                    raise
+                last_error = e
+                continue
+            self._finish(backend, ts, None)
+            return result
+        raise last_error
+
+    def stats(self) -> Dict[str, dict]:
+        """Counters of every backend."""
+        now = time.time()
+        with self._lock:
+            return {backend.name: {
+                "requests": backend.requests,
+                "failures": backend.failures,
+                "outstanding": backend.outstanding,
+                "latency_ms": round(backend.latency_ms) if backend.latency_ms is not None else None,
+                "down": backend.down_until > now,
+            } for backend in self.backends}
+
+    def _plan(self, template_name: str) -> List[LLMBackend]:
+        """Backends to try for a request, in order.
+
+        Routed backends come first, ordered by the balancing strategy, then the other backends to fail over to.
+        Backends cooling down after a failure are only tried last, soonest available first.
+        """
+        route = self.routes.get(template_name)
+        preferred = [backend for backend in self.backends if route is None or backend.name in route]
+        others = [backend for backend in self.backends if backend not in preferred]
+        now = time.time()
+        with self._lock:
+            plan = self._order([backend for backend in preferred if backend.down_until <= now])
+            plan += self._order([backend for backend in others if backend.down_until <= now])
+        plan += sorted((backend for backend in self.backends if backend.down_until > now), key=lambda backend: backend.down_until)
+        return plan
+
+    def _order(self, backends: List[LLMBackend]) -> List[LLMBackend]:
+        if not backends:
+            return []
+        if self.strategy == "weighted":
+            # Smooth weighted round-robin picks the first backend, the others follow by weight
+            total = sum(backend.weight for backend in backends)
+            for backend in backends:
+                backend.current_weight += backend.weight
+            first = max(backends, key=lambda backend: backend.current_weight)
+            first.current_weight -= total
+            return [first] + sorted((backend for backend in backends if backend is not first), key=lambda backend: -backend.weight)
+
+        # Least outstanding requests relative to the weight, preferring backends below their own concurrency, then the faster
+        return sorted(backends, key=lambda backend: (
+            backend.outstanding >= backend.client.max_concurrency,
+            (backend.outstanding + 1) / backend.weight,
+            backend.latency_ms or 0.0,
+        ))
+
+    def _start(self, backend: LLMBackend) -> float:
+        with self._lock:
+            backend.outstanding += 1
+        return time.time()
+
+    def _finish(self, backend: LLMBackend, ts: float, error: Optional[BaseException], failure_recorded: bool = False) -> None:
+        with self._lock:
+            backend.outstanding -= 1
+            backend.requests += 1
+            if error is None or not _is_backend_failure(error):
+                latency_ms = (time.time() - ts) * 1000
+                backend.latency_ms = latency_ms if backend.latency_ms is None else 0.8 * backend.latency_ms + 0.2 * latency_ms
+                backend.consecutive_failures = 0
+                return
+        if not failure_recorded:
+            self._mark_failed(backend, error)
+
+    def _mark_failed(self, backend: LLMBackend, error: BaseException) -> None:
+        with self._lock:
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            cooldown = min(self.max_cooldown_seconds, self.cooldown_seconds * 2 ** (backend.consecutive_failures - 1))
+            backend.down_until = time.time() + cooldown
+        logger.warning(f"Backend {backend.name} failed ({str(error)}), skipping it for {cooldown:.0f}s")
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Sized well above the concurrency, so requests do not time out while queued for a worker
+                self._executor = ThreadPoolExecutor(max_workers=max(32, self.max_concurrency * 2), thread_name_prefix="llm-router")
+            return self._executor
@@ -0,0 +1,107 @@
+import json
+from typing import Generic, List, Optional, Type, TypeVar, get_args
+
+from pydantic import BaseModel, ValidationError
+
+from common.logger import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar('T', bound=BaseModel)
+
+
+def item_model(output_model: Type[BaseModel], items_field: str) -> Type[BaseModel]:
+    """Model of the items of a list field, e.g. EmailSummary for `EmailSummarizingBatchResult.emails`."""
+    annotation = output_model.model_fields[items_field].annotation
+    args = get_args(annotation)
+    if not args or not isinstance(args[0], type) or not issubclass(args[0], BaseModel):
+        raise ValueError(f"{output_model.__name__}.{items_field} is not a list of models")
+    return args[0]
+
+
+class JsonItemStream(Generic[T]):
+    """Incremental parser of the items of a top-level JSON array field, e.g. `{"emails": [{...}, {...}]}`.
+
+    Text is fed as it is generated. Every item is parsed and validated against the item model as soon as
+    its closing bracket arrives, so the valid items of a truncated or malformed response are kept.
+    """
+
+    def __init__(self, items_field: str, model: Type[T]):
+        """
+        Args:
+            items_field: Key of the array in the top-level object
+            model: Model each item is validated against
+        """
+        self.items_field = items_field
+        self.model = model
+        self.items: List[T] = []
+        self.invalid_count = 0
+        # Scanner state: open containers ('{' or '['), whether inside a string and after a backslash
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escaped = False
+        # Last string seen in the top-level object, which is the key when the array opens
+        self._string_start: Optional[int] = None
+        self._last_key: Optional[str] = None
+        # Start of the current item in `_buffer`, when inside the target array
+        self._in_items = False
+        self._item_start: Optional[int] = None
+        self._buffer = ""
+        self._position = 0
+
+    def feed(self, chunk: str) -> None:
+        """Consume the next piece of the response."""
+        self._buffer += chunk
+        buffer = self._buffer
+        for position in range(self._position, len(buffer)):
+            char = buffer[position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1 and self._string_start is not None:
+                        self._last_key = buffer[self._string_start + 1:position]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = position
+            elif char in "{[":
+                if self._in_items and len(self._stack) == 2:
+                    self._item_start = position
+                if char == "[" and len(self._stack) == 1 and self._last_key == self.items_field:
+                    self._in_items = True
+                self._stack.append(char)
+            elif char in "}]":
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if self._in_items and len(self._stack) == 2 and self._item_start is not None:
+                    self._add_item(buffer[self._item_start:position + 1])
+                    self._item_start = None
+                elif self._in_items and len(self._stack) == 1:
+                    self._in_items = False
+        self._position = len(buffer)
+
+        # Only keep the part of the buffer an unfinished item or top-level key still needs
+        keep_from = len(buffer)
+        if self._item_start is not None:
+            keep_from = self._item_start
+        if self._in_string and len(self._stack) == 1 and self._string_start is not None:
+            keep_from = min(keep_from, self._string_start)
+        self._buffer = buffer[keep_from:]
+        self._position -= keep_from
+        if self._item_start is not None:
+            self._item_start -= keep_from
+        if self._string_start is not None:
+            self._string_start = self._string_start - keep_from if self._string_start >= keep_from else None
+
+    def _add_item(self, text: str) -> None:
+        try:
+            self.items.append(self.model.model_validate(json.loads(text)))
+        except (json.JSONDecodeError, ValidationError):
+            self.invalid_count += 1
+            logger.warning(f"Skipping invalid {self.model.__name__} item: {text[:200]}")
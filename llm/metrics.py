@@ -0,0 +1,192 @@
+from bisect import bisect_left
+from dataclasses import dataclass, field
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from common.utils import safe_write_file
+
+
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+@dataclass
+class _Series:
+    """Counters of one (template, model) pair."""
+    requests: int = 0
+    cache_hits: int = 0
+    parse_failures: int = 0
+    errors: int = 0
+    retries: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_input_tokens: int = 0
+    latency_sum_ms: int = 0
+    # Non-cumulative counts per bucket, the last one counts requests above the largest bound
+    latency_buckets: List[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1))
+
+
+class LLMMetrics:
+    """Aggregates per-request LLM metrics by template name and model.
+
+    Counters are kept in process and can be read with `snapshot()`, dumped in the Prometheus text format
+    with `to_prometheus()`, and every request can also be appended to a JSONL trace file.
+    """
+
+    def __init__(self, trace_path: Optional[str] = None):
+        """Initialize the metrics.
+
+        Args:
+            trace_path: Path of a JSONL file each request is appended to. If not provided, no trace is written
+        """
+        self._series: Dict[Tuple[str, str], _Series] = {}
+        self._lock = threading.Lock()
+        self._trace = None
+        if trace_path is not None:
+            if os.path.dirname(trace_path):
+                os.makedirs(os.path.dirname(trace_path), exist_ok=True)
+            self._trace = open(trace_path, 'a', encoding='utf-8')
+
+    def record(self,
+               request_id: str,
+               template: str,
+               model: Optional[str],
+               latency_ms: int,
+               input_tokens: int = 0,
+               output_tokens: int = 0,
+               cached_input_tokens: int = 0,
+               cache_hit: bool = False,
+               outcome: str = "ok") -> None:
+        """Record a finished request.
+
+        Args:
+            request_id: Identifier of the request, as shown in the logs
+            template: Name of the template the request was rendered from
+            model: Model the request was sent to
+            latency_ms: Time spent getting the response
+            input_tokens: Prompt tokens consumed, 0 for cached responses
+            output_tokens: Completion tokens consumed, 0 for cached responses
+            cached_input_tokens: Prompt tokens the provider reused from its prompt cache, estimated for Ollama which does not report it
+            cache_hit: Whether the response came from the response cache
+            outcome: "ok", "parse_failure" or "error"
+        """
+        with self._lock:
+            series = self._get_series(template, model)
+            series.requests += 1
+            series.cache_hits += int(cache_hit)
+            series.parse_failures += int(outcome == "parse_failure")
+            series.errors += int(outcome == "error")
+            series.input_tokens += input_tokens
+            series.output_tokens += output_tokens
+            series.cached_input_tokens += cached_input_tokens
+            series.latency_sum_ms += latency_ms
+            series.latency_buckets[bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+
+            if self._trace is not None:
+                self._trace.write(json.dumps({
+                    "ts": time.time(),
+                    "request_id": request_id,
+                    "template": template,
+                    "model": model,
+                    "latency_ms": latency_ms,
+                    "input_tokens": input_tokens,
+                    "output_tokens": output_tokens,
+                    "cached_input_tokens": cached_input_tokens,
+                    "cache_hit": cache_hit,
+                    "outcome": outcome,
+                }) + "\n")
+                self._trace.flush()
+
+    def record_retry(self, template: str, model: Optional[str]) -> None:
+        """Record a retried request, e.g. after a rate limit or a transient server error."""
+        with self._lock:
+            self._get_series(template, model).retries += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, dict]]:
+        """Current counters as `{template: {model: counters}}`."""
+        with self._lock:
+            result: Dict[str, Dict[str, dict]] = {}
+            for (template, model), series in self._series.items():
+                result.setdefault(template, {})[model] = {
+                    "requests": series.requests,
+                    "cache_hits": series.cache_hits,
+                    "parse_failures": series.parse_failures,
+                    "errors": series.errors,
+                    "retries": series.retries,
+                    "input_tokens": series.input_tokens,
+                    "output_tokens": series.output_tokens,
+                    "cached_input_tokens": series.cached_input_tokens,
+                    "latency_sum_ms": series.latency_sum_ms,
+                    "latency_buckets": dict(zip([*map(str, LATENCY_BUCKETS_MS), "+Inf"], series.latency_buckets)),
+                }
+            return result
+
+    def summary(self) -> str:
+        """One line per template and model, most time-consuming first."""
+        lines = []
+        for template, models in self.snapshot().items():
+            for model, counters in models.items():
+                requests = counters["requests"]
+                lines.append((counters["latency_sum_ms"], (
+                    f"{template} [{model}]: {requests} requests, {counters['cache_hits']} cached, "
+                    f"{counters['parse_failures']} parse failures, {counters['errors']} errors, {counters['retries']} retries, "
+                    f"{counters['input_tokens']} input ({counters['cached_input_tokens']} prompt-cached) / {counters['output_tokens']} output tokens, "
+                    f"{counters['latency_sum_ms'] // max(1, requests)}ms avg latency"
+                )))
+        return "\n".join(line for _, line in sorted(lines, reverse=True))
+
+    def to_prometheus(self) -> str:
+        """Counters in the Prometheus text exposition format."""
+        counters = [
+            ("llm_requests_total", "Requests sent through the LLM client", "requests"),
+            ("llm_cache_hits_total", "Requests answered by the response cache", "cache_hits"),
+            ("llm_parse_failures_total", "Responses that could not be parsed into the output model", "parse_failures"),
+            ("llm_errors_total", "Requests that failed for another reason", "errors"),
+            ("llm_retries_total", "Retried requests", "retries"),
+            ("llm_input_tokens_total", "Prompt tokens consumed", "input_tokens"),
+            ("llm_output_tokens_total", "Completion tokens consumed", "output_tokens"),
+            ("llm_cached_input_tokens_total", "Prompt tokens reused from the provider's prompt cache", "cached_input_tokens"),
+        ]
+        with self._lock:
+            series_items = sorted(self._series.items())
+            lines: List[str] = []
+            for metric, help_text, attribute in counters:
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} counter")
+                for (template, model), series in series_items:
+                    lines.append(f"{metric}{{{self._labels(template, model)}}} {getattr(series, attribute)}")
+
+            lines.append("# HELP llm_request_latency_ms Time spent getting a response")
+            lines.append("# TYPE llm_request_latency_ms histogram")
+            for (template, model), series in series_items:
+                labels = self._labels(template, model)
+                cumulative = 0
+                for bound, count in zip([*map(str, LATENCY_BUCKETS_MS), "+Inf"], series.latency_buckets):
+                    cumulative += count
+                    lines.append(f'llm_request_latency_ms_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"llm_request_latency_ms_sum{{{labels}}} {series.latency_sum_ms}")
+                lines.append(f"llm_request_latency_ms_count{{{labels}}} {series.requests}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Dump the counters in the Prometheus text format, e.g. for the node exporter textfile collector."""
+        safe_write_file(path, self.to_prometheus())
+
+    def close(self) -> None:
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+    def _get_series(self, template: str, model: Optional[str]) -> _Series:
+        key = (template, model or "unknown")
+        if key not in self._series:
+            self._series[key] = _Series()
+        return self._series[key]
+
+    @staticmethod
+    def _labels(template: str, model: str) -> str:
+        def escape(value: str) -> str:
+            return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        return f'template="{escape(template)}",model="{escape(model)}"'
@@ -0,0 +1,112 @@
+from dataclasses import dataclass
+import re
+import threading
+import time
+from typing import Mapping, Optional
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse a rate-limit reset duration such as "7.66s", "2m59.56s" or "120ms" into seconds."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_SECONDS[unit] for amount, unit in parts)
+
+
+@dataclass
+class _Budget:
+    """A replenishing quota, e.g. tokens per minute."""
+    limit: float
+    remaining: float
+    refill_per_second: float
+    updated_at: float
+
+    def available(self, now: float) -> float:
+        return min(self.limit, self.remaining + self.refill_per_second * (now - self.updated_at))
+
+
+class RateLimiter:
+    """Client-side pacing of requests under a provider's request and token quotas.
+
+    Quotas are learned from the `x-ratelimit-*` response headers: the remaining amount is assumed to refill
+    linearly up to the limit by the reported reset time. Every request reserves its estimated cost up front and
+    waits until the quota can cover it, so concurrent requests queue in order instead of all hitting a 429.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        """Initialize the limiter.
+
+        Args:
+            requests_per_minute: Request quota assumed until one is reported by the provider. None to not limit until then
+            tokens_per_minute: Token quota assumed until one is reported by the provider. None to not limit until then
+        """
+        now = time.monotonic()
+        self._lock = threading.Lock()
+        self._requests = _Budget(requests_per_minute, requests_per_minute, requests_per_minute / 60, now) if requests_per_minute else None
+        self._tokens = _Budget(tokens_per_minute, tokens_per_minute, tokens_per_minute / 60, now) if tokens_per_minute else None
+        self._blocked_until = 0.0
+
+    def reserve(self, tokens: int) -> float:
+        """Reserve one request of an estimated number of tokens.
+
+        Returns:
+            Seconds to wait before sending the request
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._blocked_until - now)
+            for budget, cost in ((self._requests, 1), (self._tokens, tokens)):
+                if budget is None:
+                    continue
+                # A request larger than the whole quota can only wait for a full refill
+                cost = min(cost, budget.limit)
+                available = budget.available(now)
+                if available < cost and budget.refill_per_second > 0:
+                    delay = max(delay, (cost - available) / budget.refill_per_second)
+                # Later requests queue behind this reservation
+                budget.remaining = available - cost
+                budget.updated_at = now
+            return delay
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        """Resynchronize the quotas with the rate-limit headers of a response.
+
+        The reported numbers do not include requests still in flight, so the limiter may briefly overshoot;
+        the resulting 429 responses are retried by the client.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._requests = self._read_budget(headers, "requests", now) or self._requests
+            self._tokens = self._read_budget(headers, "tokens", now) or self._tokens
+
+    def block(self, seconds: float) -> None:
+        """Hold every request for some time, e.g. the `retry-after` of a rate-limited response."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    @staticmethod
+    def _read_budget(headers: Mapping[str, str], kind: str, now: float) -> Optional[_Budget]:
+        try:
+            limit = float(headers[f"x-ratelimit-limit-{kind}"])
+            remaining = float(headers[f"x-ratelimit-remaining-{kind}"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if limit <= 0:
+            return None
+        reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+        if reset and reset > 0:
+            refill_per_second = max(limit - remaining, 0) / reset
+        else:
+            refill_per_second = limit / 60
+        # A full quota carries no information on the refill rate, assume it refills within a minute
+        return _Budget(limit, remaining, refill_per_second or limit / 60, now)
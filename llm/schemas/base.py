@@ -1,14 +1,42 @@
-from typing import Generic, Optional, Type, TypeVar
-from pydantic import BaseModel
+from typing import Dict, Generic, Optional, Tuple, Type, TypeVar, Union
+from pydantic import BaseModel, PrivateAttr
+import pystache
+from pystache.parsed import ParsedTemplate
 
 T = TypeVar('T', bound=BaseModel)
 
 
 class LLMTemplate(BaseModel, Generic[T]):
+    # Identifies the template in logs and metrics
+    name: str
     system_message: str
     user_message: str
     output_model: Type[T]
 
+    # Mustache source -> parsed template, or the source itself when it has no tags
+    _compiled: Dict[str, Union[str, ParsedTemplate]] = PrivateAttr(default_factory=dict)
+
+    def render(self, params: Optional[dict] = None) -> Tuple[str, str]:
+        """Render the system and user messages with the given parameters.
+
+        Each message is parsed once and the parsed template is reused by later calls.
+        Messages without any mustache tag are returned verbatim.
+
+        Returns:
+            Tuple[str, str]: The rendered system message and user message
+        """
+        return self._render(self.system_message, params), self._render(self.user_message, params)
+
+    def _render(self, source: str, params: Optional[dict]) -> str:
+        compiled = self._compiled.get(source)
+        if compiled is None:
+            compiled = pystache.parse(source) if "{{" in source else source
+            self._compiled[source] = compiled
+        if isinstance(compiled, str):
+            return compiled
+        # Renderers keep per-call state, so one is created per render to stay thread-safe
+        return pystache.Renderer().render(compiled, params)
+
 
 class LLMRequest(BaseModel):
     system_message: str
@@ -16,11 +44,15 @@ class LLMRequest(BaseModel):
     temperature: float = 0.3
     max_tokens: int = 4096
     model: Optional[str] = None
+    # Name of the template the request was rendered from, for logs and metrics
+    template_name: Optional[str] = None
 
 
 class LLMTokenUsage(BaseModel):
     input_token: int
     output_token: int
+    # Prompt tokens served from the provider's prompt cache instead of being evaluated, estimated when not reported
+    cached_input_token: int = 0
 
 
 class LLMResponse(BaseModel):
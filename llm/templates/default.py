@@ -8,6 +8,7 @@ class DefaultResult(BaseModel):
 
 
 DefaultTemplate = LLMTemplate(
+    name="DefaultTemplate",
     system_message="You are a helpful assistant.",
     user_message="",
     output_model=DefaultResult,
@@ -7,8 +7,10 @@ class EmailSummarizingResult(BaseModel):
 
 
 EmailSummarizingPrompt = LLMTemplate(
-    system_message="""You are a personal secretary of your boss. You are going to summarize emails that your boss has received or sent.""",
-    user_message="""You are given the content of an email received or sent by your boss.
+    name="EmailSummarizingPrompt",
+    system_message="""You are a personal secretary of your boss. You are going to summarize emails that your boss has received or sent.
+
+You will be given the content of an email received or sent by your boss.
 
 - Think step by step and reason through the task.
 - Summarize the email into a detailed note.
@@ -23,17 +25,18 @@ You must return a JSON object with following schema:
     "thought": str,
     "summary": str
 }
+</JsonSchema>
 
-[Email Details]
+[Boss Persona]
+{{{persona}}}
+""",
+    user_message="""[Email Details]
 Subject: {{{subject}}}
 Date: {{{date}}}
 Sender: {{{sender}}}
 Recipient: {{{recipient}}}
 Email Content (In markdown format):
 {{{content}}}
-
-[Boss Persona]
-{{{persona}}}
 """,
     output_model=EmailSummarizingResult,
 )
@@ -0,0 +1,56 @@
+from pydantic import BaseModel
+from llm.schemas.base import LLMTemplate
+
+
+class EmailSummary(BaseModel):
+    idx: int
+    summary: str
+
+
+class EmailSummarizingBatchResult(BaseModel):
+    emails: list[EmailSummary]
+
+
+EmailSummarizingBatchPrompt = LLMTemplate(
+    name="EmailSummarizingBatchPrompt",
+    system_message="""You are a personal secretary of your boss. You are going to summarize emails that your boss has received or sent.
+
+You will be given a batch of emails received or sent by your boss.
+
+For each email:
+- Think step by step and reason through the task.
+- Summarize the email into a detailed note.
+    - Pay attention to your boss's persona provided below and think of what information your boss would concern about from this email, and make sure to include all of them in the summary.
+    - Keep the concrete informative or actionables of your boss in the summary. Make sure to include the date, time, location, and other critical descriptive information if provided.
+    - Output the summary in text form. Use a fact-based style.
+    - Do not hallucinate. Include only details from the email.
+- Summarize each email on its own. Do not mix up details between emails.
+
+You must return a JSON object with following schema:
+<JsonSchema>
+{
+    "emails": [{
+        "idx": int, # index of the email in the batch
+        "thought": str,
+        "summary": str
+    }]
+}
+</JsonSchema>
+
+[Boss Persona]
+{{{persona}}}
+""",
+    user_message="""[Email Batch]
+{{#emails}}
+Idx: {{{idx}}}
+Subject: {{{subject}}}
+Date: {{{date}}}
+Sender: {{{sender}}}
+Recipient: {{{recipient}}}
+Email Content (In markdown format):
+{{{content}}}
+---
+{{/emails}}
+""",
+    output_model=EmailSummarizingBatchResult,
+)
@@ -14,8 +14,10 @@ class InformationExtractionResult(BaseModel):
 
 
 InformationExtractionPrompt = LLMTemplate(
-    system_message="""You are a personal secretary of your boss. You are going to extract and organize information about your boss from the email he sent and received.""",
-    user_message="""You are given the summary of an email received or sent by your boss.
+    name="InformationExtractionPrompt",
+    system_message="""You are a personal secretary of your boss. You are going to extract and organize information about your boss from the email he sent and received.
+
+You will be given the summary of an email received or sent by your boss.
 
 - From the summary provided, extract the actionable or informative items explicitly mentioned in the email.
     - Pay attention to your boss's persona provided below and think of how it is related to your boss.
@@ -47,16 +49,16 @@ You must return a JSON object with following schema:
 }
 </JsonSchema>
 
-[Email Details]
+[Boss Persona]
+{{{persona}}}
+""",
+    user_message="""[Email Details]
 Subject: {{{subject}}}
 Date: {{{date}}}
 Sender: {{{sender}}}
 Recipient: {{{recipient}}}
 Email Summary:
 {{{summary}}}
-
-[Boss Persona]
-{{{persona}}}
 """,
     output_model=InformationExtractionResult,
 )
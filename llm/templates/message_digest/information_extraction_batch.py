@@ -0,0 +1,71 @@
+from pydantic import BaseModel
+from llm.schemas.base import LLMTemplate
+from llm.templates.message_digest.information_extraction import Extraction
+
+
+class EmailExtractions(BaseModel):
+    idx: int
+    extractions: list[Extraction]
+
+
+class InformationExtractionBatchResult(BaseModel):
+    emails: list[EmailExtractions]
+
+
+InformationExtractionBatchPrompt = LLMTemplate(
+    name="InformationExtractionBatchPrompt",
+    system_message="""You are a personal secretary of your boss. You are going to extract and organize information about your boss from the email he sent and received.
+
+You will be given the summaries of a batch of emails received or sent by your boss.
+
+For each email:
+- From the summary provided, extract the actionable or informative items explicitly mentioned in the email.
+    - Pay attention to your boss's persona provided below and think of how it is related to your boss.
+    - You may extract multiple information from the email. If no information can be extracted, return an empty list.
+- For each extractions, identify if it is under any (or multiple) of the following category keys and their descriptions:
+    - "hobbies": Activities pursued for fun, relaxation, and personal enjoyment.
+    - "interested_topics": Areas of curiosity or learning that draw attention.
+    - "profession": Related to career and work life.
+    - "physical_wellbeing": Related to personal health, fitness, and overall physical care.
+    - "financial": Personal income, expenses, savings, and financial planning.
+    - "household": Maintenance of the living space.
+    - "family": Immediate family relationships and responsibilities.
+    - "relationships": Connections with close partners.
+    - "friends_social": Interactions and activities of friendships and social networks.
+- Provide a detailed description of the extraction. Include the date, time, location, and other critical details.
+
+Note:
+- You should group similar extractions of the same email together into a single extraction with details that include all the details.
+- Do not hallucinate. Include only details from the email.
+
+You must return a JSON object with following schema:
+<JsonSchema>
+{
+    "emails": [{
+        "idx": int, # index of the email in the batch
+        "extractions": [{
+            "type": "actionable" | "informative",
+            "categories": [str], # related categories, keys provided above
+            "details": str, # A self-contained text description of the extraction
+        }]
+    }]
+}
+</JsonSchema>
+
+[Boss Persona]
+{{{persona}}}
+""",
+    user_message="""[Email Batch]
+{{#emails}}
+Idx: {{{idx}}}
+Subject: {{{subject}}}
+Date: {{{date}}}
+Sender: {{{sender}}}
+Recipient: {{{recipient}}}
+Email Summary:
+{{{summary}}}
+---
+{{/emails}}
+""",
+    output_model=InformationExtractionBatchResult,
+)
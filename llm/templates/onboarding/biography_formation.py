@@ -10,8 +10,9 @@ class BiographyFormationResult(BaseModel):
 
 
 BiographyFormationPrompt = LLMTemplate(
+    name="BiographyFormationPrompt",
     system_message="You are a personal secretary of your boss. You are trying to understand your boss background and personality from the emails he sent and received.",
-    user_message="""You have a list of hypoethesis about your boss, with a weight from 1 to 5 at the end of each indication how important you think the hypothesis is.
+    user_message="""You have a list of hypoethesis about your boss, with a weight from 1 to 5 at the end of each indication how important you think the hypothesis is, and how many emails support it.
 
 Write a text description about your boss in string form. The description should be detailed enough so you can use as reference later-on.
 
@@ -28,7 +29,7 @@ You must return a JSON object with following schema:
 </JsonSchema>
 
 [Hypothesis]
-{{#implications}} {{{description}}} ({{{weight}}})
+{{#implications}} {{{description}}} (weight {{{weight}}}, seen in {{{support}}} emails)
 {{/implications}}
 """,
     output_model=BiographyFormationResult,
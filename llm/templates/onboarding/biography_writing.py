@@ -10,6 +10,7 @@ class BiographyWritingResult(BaseModel):
 
 
 BiographyWritingPrompt = LLMTemplate(
+    name="BiographyWritingPrompt",
     system_message="You are a personal secretary of your boss. You are trying to understand your boss background and personality from the emails he sent and received.",
     user_message="""From the following descriptions of your boss by categories, rewrite it into a text biography of your boss.
 If you don't know your boss's name, reference with "My boss".
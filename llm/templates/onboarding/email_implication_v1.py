@@ -12,6 +12,7 @@ class EmailImplicationResult(BaseModel):
 
 
 EmailImplicationPrompt = LLMTemplate(
+    name="EmailImplicationPrompt",
     system_message=DEFAULT_TEMPLATE.system_message,
     user_message="""You are given the subject and sender of the user's email.
 Suggest any likely scenarios in which the user might receive this email. (Could be none or multiple)
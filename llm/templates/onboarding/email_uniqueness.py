@@ -9,6 +9,7 @@ class EmailUniquenessResult(BaseModel):
 
 
 EmailUniquenessPrompt = LLMTemplate(
+    name="EmailUniquenessPrompt",
     system_message=DefaultTemplate.system_message,
     user_message="""
 You are given the subject, date and sender address of an email received by your boss.
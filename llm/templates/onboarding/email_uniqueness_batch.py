@@ -14,6 +14,7 @@ class EmailUniquenessBatchResult(BaseModel):
 
 
 EmailUniquenessPrompt = LLMTemplate(
+    name="EmailUniquenessBatchPrompt",
     system_message=DefaultTemplate.system_message,
     user_message="""
 You are given the a batch of meta data of emails received or sent by your boss.
@@ -12,6 +12,7 @@ class PersonaExtractionResult(BaseModel):
 
 
 PersonaExtractionPrompt = LLMTemplate(
+    name="PersonaExtractionPrompt",
     system_message="You are a personal secretary of your boss. You are trying to understand your boss background and personality from the emails he sent and received.",
     user_message="""You are given the meta data of an email received by your boss.
 
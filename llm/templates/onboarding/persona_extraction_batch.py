@@ -17,6 +17,7 @@ class PersonaExtractionBatchResult(BaseModel):
 
 
 PersonaExtractionBatchPrompt = LLMTemplate(
+    name="PersonaExtractionBatchPrompt",
     system_message="You are a personal secretary of your boss. You are trying to understand your boss's persona from the emails he sent and received.",
     user_message="""You are given the a batch of meta data of emails received or sent by your boss.
 
@@ -0,0 +1,40 @@
+from typing import Callable, Iterable, Iterator, List, TypeVar
+
+T = TypeVar('T')
+
+# Rough average for English text on common BPE tokenizers
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens of a text without loading a tokenizer.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def pack_batches(items: Iterable[T], cost: Callable[[T], int], budget: int, max_items: int | Callable[[], int]) -> Iterator[List[T]]:
+    """
+    Group items into batches whose total cost stays within `budget`, with at most `max_items` per batch.
+
+    An item that exceeds the budget on its own is yielded as a single-item batch.
+
+    Args:
+        items: Items to group, consumed lazily
+        cost: Estimated token cost of an item
+        budget: Maximum total cost of a batch
+        max_items: Maximum number of items of a batch, or a callable returning it so the limit can adapt between batches
+    """
+    get_max_items = max_items if callable(max_items) else lambda: max_items
+    batch: List[T] = []
+    batch_cost = 0
+    for item in items:
+        item_cost = cost(item)
+        if batch and (batch_cost + item_cost > budget or len(batch) >= get_max_items()):
+            yield batch
+            batch = []
+            batch_cost = 0
+        batch.append(item)
+        batch_cost += item_cost
+    if batch:
+        yield batch
@@ -0,0 +1,76 @@
+from datetime import timedelta, timezone
+from typing import Dict, FrozenSet, Optional, Set, Tuple
+
+from common.text_similarity import MinHashIndex, jaccard, normalize_text, tokenize
+from memoboard.memo_store import Memo
+
+
+class MemoIndex:
+    """
+    Per-category index of recent memos, used to merge the near-duplicate memos of reminder and follow-up emails.
+
+    A memo is a duplicate of an indexed memo of the same type sharing one of its categories when their
+    normalized details are equal, or when their content words overlap by at least `similarity_threshold` (Jaccard),
+    and their latest source emails are at most `window_days` apart.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.6, window_days: float = 30):
+        """
+        Args:
+            similarity_threshold: Minimum Jaccard similarity of content words to merge two memos
+            window_days: Maximum number of days between the emails of two merged memos
+        """
+        self.similarity_threshold = similarity_threshold
+        self.window = timedelta(days=window_days)
+        self._memos: Dict[int, Memo] = {}
+        self._tokens: Dict[int, FrozenSet[str]] = {}
+        self._categories: Dict[int, Set[str]] = {}
+        self._exact: Dict[Tuple[str, str, str], int] = {}
+        self._minhash: Dict[str, MinHashIndex[int]] = {}
+
+    def add(self, memo_id: int, memo: Memo) -> None:
+        """
+        Index a stored memo, or re-index it after it was merged.
+        """
+        self._memos[memo_id] = memo
+        tokens = self._tokens.setdefault(memo_id, tokenize(memo.details))
+        indexed_categories = self._categories.setdefault(memo_id, set())
+        for category in memo.categories:
+            if category in indexed_categories:
+                continue
+            indexed_categories.add(category)
+            self._exact.setdefault((category, memo.type, normalize_text(memo.details)), memo_id)
+            self._minhash.setdefault(category, MinHashIndex()).insert(memo_id, tokens)
+
+    def get(self, memo_id: int) -> Memo:
+        return self._memos[memo_id]
+
+    def find(self, memo: Memo) -> Optional[int]:
+        """
+        ID of the indexed memo the given memo duplicates, None if it is new.
+        """
+        details = normalize_text(memo.details)
+        for category in memo.categories:
+            match = self._exact.get((category, memo.type, details))
+            if match is not None and self._is_recent(self._memos[match], memo):
+                return match
+
+        tokens = tokenize(memo.details)
+        if not tokens:
+            return None
+        best, best_similarity = None, 0.0
+        for category in memo.categories:
+            index = self._minhash.get(category)
+            if index is None:
+                continue
+            for memo_id in sorted(index.query(tokens)):
+                candidate = self._memos[memo_id]
+                if candidate.type != memo.type or not self._is_recent(candidate, memo):
+                    continue
+                similarity = jaccard(tokens, self._tokens[memo_id])
+                if similarity >= self.similarity_threshold and similarity > best_similarity:
+                    best, best_similarity = memo_id, similarity
+        return best
+
+    def _is_recent(self, candidate: Memo, memo: Memo) -> bool:
+        return abs(candidate.latest_date.astimezone(timezone.utc) - memo.latest_date.astimezone(timezone.utc)) <= self.window
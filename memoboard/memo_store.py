@@ -0,0 +1,259 @@
+from datetime import datetime, timezone
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Literal, Optional, Sequence, Tuple
+
+from pydantic import BaseModel, model_validator
+
+
+def _date_key(date: datetime) -> str:
+    """
+    Sortable UTC key of a date. Naive dates are taken as local time.
+    """
+    return date.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%S')
+
+
+class SourceMessage(BaseModel):
+    date: datetime
+    summary: str
+    message_id: Optional[str] = None
+
+
+class Memo(BaseModel):
+    type: Literal["actionable", "informative"]
+    source: SourceMessage
+    categories: List[str]
+    details: str
+    summary: str
+    # Every email the memo was extracted from, the first one being `source`
+    sources: List[SourceMessage] = []
+
+    @model_validator(mode='after')
+    def _default_sources(self) -> 'Memo':
+        if not self.sources:
+            self.sources = [self.source]
+        return self
+
+    @property
+    def latest_date(self) -> datetime:
+        """
+        Date of the most recent email the memo was extracted from.
+        """
+        return max((source.date for source in self.sources), key=_date_key)
+
+
+class MemoStore:
+    """
+    Memoboard in a single SQLite file.
+
+    Each memo is stored once as JSON, with its categories in a separate table, and indexed by
+    category, type and the date of its latest source email, so e.g. the actionable financial memos
+    of the week are read with one indexed query instead of walking a directory per category.
+    """
+
+    def __init__(self, path: str | Path):
+        """
+        Args:
+            path: Path of the memo database file
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS memo (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id TEXT,
+                type TEXT NOT NULL,
+                source_date TEXT NOT NULL,
+                data TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS memo_category (
+                category TEXT NOT NULL,
+                memo_id INTEGER NOT NULL REFERENCES memo (id) ON DELETE CASCADE,
+                type TEXT NOT NULL,
+                source_date TEXT NOT NULL,
+                PRIMARY KEY (category, memo_id)
+            ) WITHOUT ROWID
+        """)
+        # Type and date are copied into the category rows, so category queries are a single index range scan
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_memo_category_type_date ON memo_category (category, type, source_date)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_memo_category_date ON memo_category (category, source_date)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_memo_type_date ON memo (type, source_date)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_memo_date ON memo (source_date)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_memo_message_id ON memo (message_id)")
+        self._conn.commit()
+
+    def add(self, memo: Memo, message_id: Optional[str] = None) -> int:
+        """
+        Store a memo and return its ID.
+        """
+        return self.add_many([memo], message_id)[0]
+
+    def add_many(self, memos: List[Memo], message_id: Optional[str] = None, replace: bool = True) -> List[int]:
+        """
+        Store memos in a single transaction and return their IDs.
+
+        Args:
+            memos: Memos to store
+            message_id: ID of the email the memos were extracted from
+            replace: Replace the memos previously stored for the same email, so an email processed again
+                after an interruption is not duplicated
+        """
+        return self.write(memos, {}, message_id, replace=replace)
+
+    def update(self, memo_id: int, memo: Memo) -> None:
+        """
+        Replace a stored memo, e.g. after merging another source into it.
+        """
+        self.write([], {memo_id: memo})
+
+    def write(self,
+              new_memos: List[Memo],
+              updated_memos: Dict[int, Memo],
+              message_id: Optional[str] = None,
+              replace: bool = False) -> List[int]:
+        """
+        Store new memos and replace updated ones in a single transaction.
+
+        Args:
+            new_memos: Memos to store
+            updated_memos: Memo ID -> new content of a stored memo
+            message_id: ID of the email the new memos were extracted from
+            replace: Delete the memos previously stored for `message_id` first
+
+        Returns:
+            IDs of the new memos
+        """
+        ids: List[int] = []
+        with self._lock:
+            with self._conn:
+                if replace and message_id is not None:
+                    self._conn.execute("DELETE FROM memo WHERE message_id = ?", (message_id,))
+                for memo_id, memo in updated_memos.items():
+                    source_date = _date_key(memo.latest_date)
+                    self._conn.execute(
+                        "UPDATE memo SET type = ?, source_date = ?, data = ? WHERE id = ?",
+                        (memo.type, source_date, memo.model_dump_json(), memo_id)
+                    )
+                    self._conn.execute("DELETE FROM memo_category WHERE memo_id = ?", (memo_id,))
+                    self._insert_categories(memo_id, memo, source_date)
+                for memo in new_memos:
+                    source_date = _date_key(memo.latest_date)
+                    cursor = self._conn.execute(
+                        "INSERT INTO memo (message_id, type, source_date, data) VALUES (?, ?, ?, ?)",
+                        (message_id, memo.type, source_date, memo.model_dump_json())
+                    )
+                    ids.append(cursor.lastrowid)
+                    self._insert_categories(cursor.lastrowid, memo, source_date)
+        return ids
+
+    def query(self,
+              category: Optional[str] = None,
+              type: Optional[str] = None,
+              start: Optional[datetime] = None,
+              end: Optional[datetime] = None,
+              limit: Optional[int] = None) -> List[Memo]:
+        """
+        Memos matching all the given filters, newest first.
+
+        Args:
+            category: Only memos in this category
+            type: Only memos of this type, "actionable" or "informative"
+            start: Only memos whose latest source email is dated at or after this time
+            end: Only memos whose latest source email is dated before this time
+            limit: Maximum number of memos returned
+        """
+        return [memo for _, memo in self.iter(category=category, type=type, start=start, end=end, limit=limit)]
+
+    def iter(self,
+             category: Optional[str] = None,
+             type: Optional[str] = None,
+             start: Optional[datetime] = None,
+             end: Optional[datetime] = None,
+             limit: Optional[int] = None,
+             batch_size: int = 500) -> Iterator[Tuple[int, Memo]]:
+        """
+        Iterate over `(id, memo)` pairs matching all the given filters, newest first. See `query()`.
+        """
+        query, params, table = self._build_query(category, type, start, end)
+        remaining = limit
+
+        # Page through the date index so the lock is not held while the caller consumes memos
+        cursor: Optional[Tuple[str, int]] = None
+        while remaining is None or remaining > 0:
+            page_size = batch_size if remaining is None else min(batch_size, remaining)
+            page_query, page_params = query, list(params)
+            if cursor is not None:
+                page_query += f" AND ({table}.source_date < ? OR ({table}.source_date = ? AND m.id < ?))"
+                page_params += [cursor[0], cursor[0], cursor[1]]
+            page_query += f" ORDER BY {table}.source_date DESC, m.id DESC LIMIT ?"
+            with self._lock:
+                rows = self._conn.execute(page_query, [*page_params, page_size]).fetchall()
+            for memo_id, _, data in rows:
+                yield memo_id, Memo.model_validate_json(data)
+            if remaining is not None:
+                remaining -= len(rows)
+            if len(rows) < page_size:
+                return
+            cursor = (rows[-1][1], rows[-1][0])
+
+    def count(self, category: Optional[str] = None, type: Optional[str] = None) -> int:
+        """
+        Number of memos matching the given filters.
+        """
+        query, params, _ = self._build_query(category, type, None, None, columns="COUNT(*)")
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()[0]
+
+    def categories(self) -> List[Tuple[str, int]]:
+        """
+        Categories and their number of memos, largest first.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT category, COUNT(*) AS n FROM memo_category GROUP BY category ORDER BY n DESC, category"
+            ).fetchall()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _insert_categories(self, memo_id: int, memo: Memo, source_date: str) -> None:
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO memo_category (category, memo_id, type, source_date) VALUES (?, ?, ?, ?)",
+            [(category, memo_id, memo.type, source_date) for category in memo.categories]
+        )
+
+    def _build_query(self,
+                     category: Optional[str],
+                     type: Optional[str],
+                     start: Optional[datetime],
+                     end: Optional[datetime],
+                     columns: str = "m.id, m.source_date, m.data") -> Tuple[str, Sequence, str]:
+        """
+        Filtering query, its parameters and the alias of the table whose type and date columns it filters on.
+        """
+        if category is not None:
+            table = "c"
+            query = f"SELECT {columns} FROM memo_category c JOIN memo m ON m.id = c.memo_id WHERE c.category = ?"
+            params: List = [category]
+        else:
+            table = "m"
+            query = f"SELECT {columns} FROM memo m WHERE 1 = 1"
+            params = []
+        if type is not None:
+            query += f" AND {table}.type = ?"
+            params.append(type)
+        if start is not None:
+            query += f" AND {table}.source_date >= ?"
+            params.append(_date_key(start))
+        if end is not None:
+            query += f" AND {table}.source_date < ?"
+            params.append(_date_key(end))
+        return query, params, table
@@ -1,36 +1,101 @@
-from datetime import datetime
-from typing import List, Literal
-from uuid import uuid4
-from pydantic import BaseModel
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+import glob
+import os
+import threading
+from typing import Dict, Iterable, List, Set
 from common.logger import get_logger
-from common.utils import safe_write_file
+from common.utils import append_line
 from data_loader.base_email_fetcher import EmailMessage
 from llm.clients.base_llm_client import BaseLLMClient
-from llm.templates.message_digest.information_extraction import InformationExtractionPrompt
+from llm.templates.message_digest.information_extraction import Extraction, InformationExtractionPrompt
+from llm.templates.message_digest.information_extraction_batch import InformationExtractionBatchPrompt
 from llm.templates.message_digest.email_summarizing import EmailSummarizingPrompt
+from llm.templates.message_digest.email_summarizing_batch import EmailSummarizingBatchPrompt
+from llm.token_budget import estimate_tokens, pack_batches
+from memoboard.memo_index import MemoIndex
+from memoboard.memo_store import Memo, MemoStore, SourceMessage
 
 
 logger = get_logger(__name__)
 
 
-class SourceMessage(BaseModel):
-    date: datetime
-    summary: str
-
-
-class Memo(BaseModel):
-    type: Literal["actionable", "informative"]
-    source: SourceMessage
-    categories: List[str]
-    details: str
-    summary: str
-
-
 class MemoboardBuilder:
-    def __init__(self, llm_client: BaseLLMClient, persona: str, storage_path: str):
+    def __init__(self, llm_client: BaseLLMClient, persona: str, storage_path: str, dedup: bool = True, dedup_window_days: float = 30):
+        """
+        Args:
+            llm_client: Client used to summarize emails and extract memos
+            persona: Persona description of the mailbox owner
+            storage_path: Output directory
+            dedup: Merge memos into a near-duplicate memo of the same category instead of storing them again
+            dedup_window_days: Maximum number of days between the emails of merged memos
+        """
         self.llm_client = llm_client
         self.persona = persona
         self._storage_path = f"{storage_path}/memoboard"
+        self._progress_path = f"{self._storage_path}/processed.txt"
+        self._progress_lock = threading.Lock()
+        self._processed_ids = self._load_progress()
+        self.memo_store = MemoStore(f"{self._storage_path}/memos.db")
+        self._import_legacy_memos()
+        self._memo_lock = threading.Lock()
+        self._memo_index = self._load_memo_index(dedup_window_days) if dedup else None
+        self.merged_count = 0
+
+    def process_emails(self,
+                       emails: Iterable[EmailMessage],
+                       max_workers: int = 4,
+                       batch_size: int = 1,
+                       token_budget: int = 6000) -> int:
+        """
+        Process many emails with a pool of workers, and return the number of memos extracted.
+
+        With `batch_size` > 1, emails are packed into batched prompts of up to `batch_size` emails
+        whose estimated prompt size stays within `token_budget`, so the persona is sent once per batch
+        instead of once per email.
+
+        Every processed email is checkpointed, so running again with the same storage path
+        skips the emails that were already processed and resumes from where it stopped.
+        Emails that fail are logged and left unprocessed for the next run.
+        Memos are only kept in the memo store, read them back with `memo_store.query()`.
+        """
+        memo_count = 0
+        pending: Dict[Future, List[EmailMessage]] = {}
+
+        def collect(future: Future):
+            nonlocal memo_count
+            email_batch = pending.pop(future)
+            try:
+                memo_count += len(future.result())
+            except Exception as e:
+                logger.error(f"Failed to process emails {[email.message_id for email in email_batch]}: {str(e)}")
+
+        unprocessed = (email for email in emails if email.message_id not in self._processed_ids)
+        if batch_size > 1:
+            email_batches = pack_batches(
+                unprocessed,
+                cost=self._estimate_email_tokens,
+                budget=token_budget - estimate_tokens(EmailSummarizingBatchPrompt.system_message + EmailSummarizingBatchPrompt.user_message + self.persona),
+                max_items=batch_size,
+            )
+        else:
+            email_batches = ([email] for email in unprocessed)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for email_batch in email_batches:
+                # Keep a bounded number of batches in flight, so large inputs are not all held in memory
+                if len(pending) >= max_workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future)
+                if len(email_batch) == 1:
+                    pending[executor.submit(self.process_email, email_batch[0])] = email_batch
+                else:
+                    pending[executor.submit(self.process_email_batch, email_batch)] = email_batch
+
+            for future in as_completed(list(pending)):
+                collect(future)
+
+        return memo_count
 
     def process_email(self, email: EmailMessage) -> List[Memo]:
         summary_result = self.llm_client.prompt(
@@ -56,21 +121,174 @@ class MemoboardBuilder:
             }
         )
 
-        memos: List[Memo] = []
-        for extraction in extraction_result.extractions:
-            memo = Memo(
-                type=extraction.type,
-                source=SourceMessage(date=email.date, summary=summary_result.summary),
-                categories=extraction.categories,
-                details=extraction.details,
-                summary=summary_result.summary,
+        return self._create_memos(email, summary_result.summary, extraction_result.extractions)
+
+    def process_email_batch(self, email_batch: List[EmailMessage]) -> List[Memo]:
+        """
+        Process a batch of emails with one summarizing and one extraction prompt.
+
+        Results are mapped back to the emails by "idx", and valid results are kept even when a response
+        is truncated or malformed. Emails missing from either result are prompted again as a smaller batch,
+        or on their own once no batch result can be salvaged.
+        """
+        summary_result, _ = self.llm_client.prompt_items(
+            template=EmailSummarizingBatchPrompt,
+            template_params={
+                "persona": self.persona,
+                "emails": [{
+                    "idx": idx,
+                    "subject": email.subject,
+                    "date": email.date,
+                    "sender": email.sender,
+                    "recipient": email.to,
+                    "content": email.body,
+                } for idx, email in enumerate(email_batch)],
+            },
+        )
+        summaries = {e.idx: e.summary for e in summary_result.emails if 0 <= e.idx < len(email_batch)}
+
+        extractions: Dict[int, List[Extraction]] = {}
+        if summaries:
+            extraction_result, _ = self.llm_client.prompt_items(
+                template=InformationExtractionBatchPrompt,
+                template_params={
+                    "persona": self.persona,
+                    "emails": [{
+                        "idx": idx,
+                        "subject": email_batch[idx].subject,
+                        "date": email_batch[idx].date,
+                        "sender": email_batch[idx].sender,
+                        "recipient": email_batch[idx].to,
+                        "summary": summary,
+                    } for idx, summary in summaries.items()],
+                },
             )
-            self._save_memo(memo)
-            memos.append(memo)
+            extractions = {e.idx: e.extractions for e in extraction_result.emails if e.idx in summaries}
+
+        memos: List[Memo] = []
+        missing_emails: List[EmailMessage] = []
+        for idx, email in enumerate(email_batch):
+            if idx in extractions:
+                memos.extend(self._create_memos(email, summaries[idx], extractions[idx]))
+            else:
+                missing_emails.append(email)
+
+        if 1 < len(missing_emails) < len(email_batch):
+            logger.warning(f"Re-requesting {len(missing_emails)} of {len(email_batch)} emails missing from the batch result")
+            memos.extend(self.process_email_batch(missing_emails))
+        else:
+            for email in missing_emails:
+                logger.warning(f"Email {email.message_id} missing from batch result, processing it alone")
+                memos.extend(self.process_email(email))
+        return memos
+
+    def _create_memos(self, email: EmailMessage, summary: str, extractions: List[Extraction]) -> List[Memo]:
+        """
+        Create and save the memos of an email, then mark the email as processed.
+
+        A memo duplicating a recent memo of the same category is merged into it, adding the email to its sources.
+        """
+        memos = [Memo(
+            type=extraction.type,
+            source=SourceMessage(date=email.date, summary=summary, message_id=email.message_id),
+            categories=extraction.categories,
+            details=extraction.details,
+            summary=summary,
+        ) for extraction in extractions]
+
+        if self._memo_index is None:
+            self.memo_store.add_many(memos, message_id=email.message_id)
+        else:
+            # Serialize lookups and writes, so concurrent emails with the same memo do not both store it
+            with self._memo_lock:
+                self._save_deduplicated(memos, email.message_id)
+
+        self._mark_processed(email.message_id)
         return memos
 
-    def _save_memo(self, memo: Memo):
-        for category in memo.categories:
-            uuid = str(uuid4())
-            file_path = f"{self._storage_path}/{category}/{str(uuid)[:8]}.json"
-            safe_write_file(file_path, memo.model_dump_json())
+    def _save_deduplicated(self, memos: List[Memo], message_id: str) -> None:
+        """
+        Store the memos of an email in one transaction, merging the duplicates of indexed memos into them.
+
+        Memos are not replaced by message ID here, as a stored memo may also hold the sources of other emails.
+        Instead, an email already among the sources of its duplicate is not merged again.
+        """
+        new_memos: List[Memo] = []
+        # Duplicates among the memos of this email collapse into the first one
+        email_index = MemoIndex(similarity_threshold=self._memo_index.similarity_threshold)
+        merged: Dict[int, Memo] = {}
+        for position, memo in enumerate(memos):
+            if email_index.find(memo) is not None:
+                continue
+            email_index.add(position, memo)
+            memo_id = self._memo_index.find(memo)
+            if memo_id is None:
+                new_memos.append(memo)
+                continue
+            # Merged into a copy, so the index is only changed once the transaction succeeds
+            existing = merged.get(memo_id) or self._memo_index.get(memo_id).model_copy(deep=True)
+            if any(source.message_id == message_id for source in existing.sources):
+                continue
+            existing.sources.append(memo.source)
+            existing.categories.extend(category for category in memo.categories if category not in existing.categories)
+            merged[memo_id] = existing
+            logger.debug(f"Merging memo into #{memo_id}, now from {len(existing.sources)} emails: {memo.details}")
+
+        new_ids = self.memo_store.write(new_memos, merged, message_id=message_id)
+        for memo_id, memo in zip(new_ids, new_memos):
+            self._memo_index.add(memo_id, memo)
+        for memo_id, memo in merged.items():
+            self._memo_index.add(memo_id, memo)
+        self.merged_count += len(merged)
+
+    def _load_memo_index(self, window_days: float) -> MemoIndex:
+        """
+        Index the stored memos recent enough to be merged with the memos of new emails.
+        """
+        memo_index = MemoIndex(window_days=window_days)
+        newest = next(self.memo_store.iter(limit=1), None)
+        if newest is not None:
+            for memo_id, memo in self.memo_store.iter(start=newest[1].latest_date - memo_index.window):
+                memo_index.add(memo_id, memo)
+        return memo_index
+
+    @staticmethod
+    def _estimate_email_tokens(email: EmailMessage) -> int:
+        return estimate_tokens(f"{email.subject}{email.date}{email.sender}{email.to}{email.body}") + 20
+
+    def _import_legacy_memos(self) -> None:
+        """
+        Move memos of a previous run saved as one JSON file per category into the memo store.
+
+        Such a memo was copied into every one of its categories, so identical copies are imported once.
+        """
+        paths = glob.glob(f"{self._storage_path}/*/*.json")
+        if not paths or self.memo_store.count() > 0:
+            return
+        seen: Set[str] = set()
+        memos: List[Memo] = []
+        for path in sorted(paths):
+            with open(path, "r", encoding="utf-8") as f:
+                data = f.read()
+            if data not in seen:
+                seen.add(data)
+                memos.append(Memo.model_validate_json(data))
+        self.memo_store.add_many(memos)
+        logger.info(f"Imported {len(memos)} memos from {len(paths)} legacy memo files")
+
+    def _load_progress(self) -> Set[str]:
+        """
+        Load the message IDs of already processed emails.
+        """
+        if not os.path.exists(self._progress_path):
+            return set()
+        with open(self._progress_path, "r", encoding="utf-8") as f:
+            return {line.rstrip("\n") for line in f if line.strip()}
+
+    def _mark_processed(self, message_id: str) -> None:
+        """
+        Append a processed message ID to the progress file.
+        """
+        with self._progress_lock:
+            append_line(self._progress_path, message_id)
+            self._processed_ids.add(message_id)
@@ -0,0 +1,200 @@
+from collections import Counter
+from email.utils import parseaddr
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from common.logger import get_logger
+from common.utils import append_line, safe_write_file
+from data_loader.email_message import EmailMessage
+
+
+logger = get_logger(__name__)
+
+AUTOMATED_SENDER_PATTERN = re.compile(r"(no-?reply|do-?not-?reply|newsletter|news|marketing|promo|notifications?|mailer-daemon|bounce)", re.IGNORECASE)
+
+
+class EmailPrefilter:
+    """
+    Cheap, deterministic pre-scoring of emails before they reach the LLM.
+
+    Emails get a bulk score from mailing list headers, automated sender addresses and how often
+    their sender domain has been seen. Bulk emails are dropped, borderline ones are kept with a capped weight.
+    Senders with enough uniqueness scores from earlier LLM results are judged by those scores instead,
+    so newsletters the user cares about are kept and uninteresting senders are dropped without any header hint.
+    Like the uniqueness cache, learned scores lose weight with a half-life, and a sample of the emails of dropped
+    senders is still sent to the LLM, so a sender whose emails become relevant can recover.
+    """
+
+    def __init__(self,
+                 storage_path: str,
+                 drop_score: int = 4,
+                 downweight_score: int = 2,
+                 downweight_cap: int = 2,
+                 frequent_domain_count: int = 20,
+                 min_observations: float = 3,
+                 learned_drop_score: float = 1.5,
+                 half_life_days: float = 30,
+                 rescore_rate: float = 0.1):
+        """
+        Args:
+            storage_path: Directory where the learned sender scores are persisted
+            drop_score: Bulk score at which an email is dropped
+            downweight_score: Bulk score at which the hypotheses of an email are capped to `downweight_cap`
+            downweight_cap: Maximum weight of hypotheses from borderline bulk emails
+            frequent_domain_count: Number of emails from a sender domain after which it counts as high-volume
+            min_observations: Decayed number of uniqueness scores needed before a sender's learned score is trusted
+            learned_drop_score: Senders whose average uniqueness score is at or below this are dropped
+            half_life_days: Age after which a learned uniqueness score counts half
+            rescore_rate: Fraction of the emails of senders dropped by their learned score that are kept to be scored again
+        """
+        self.drop_score = drop_score
+        self.downweight_score = downweight_score
+        self.downweight_cap = downweight_cap
+        self.frequent_domain_count = frequent_domain_count
+        self.min_observations = min_observations
+        self.learned_drop_score = learned_drop_score
+        self.half_life_seconds = half_life_days * 24 * 3600
+        self.rescore_rate = rescore_rate
+        self._path = f"{storage_path}/sender_scores.json"
+        self._counted_ids_path = f"{storage_path}/counted_ids.txt"
+        # Sender -> {"weight": decayed observation count, "mean": score mean, "updated_at": epoch seconds}
+        self._sender_scores: Dict[str, Dict[str, float]] = {}
+        self._domain_counts: Counter = Counter()
+        # Emails already counted in `_domain_counts`, so emails filtered again on a later run are not counted twice.
+        # Those counted since the last save are appended to the counted IDs file on save
+        self._counted_ids: Set[str] = set()
+        self._unsaved_ids: List[str] = []
+        self._weight_caps: Dict[str, int] = {}
+        self.dropped_count = 0
+        self.kept_count = 0
+        self._load()
+
+    def filter(self, emails: Iterable[EmailMessage]) -> Iterator[EmailMessage]:
+        """
+        Yield the emails worth sending to the LLM, dropping bulk mail.
+        Weight caps of down-weighted emails are available from `weight_cap()`.
+        """
+        for email in emails:
+            address = self._address(email)
+            domain = address.rpartition("@")[2]
+            if email.message_id not in self._counted_ids:
+                self._counted_ids.add(email.message_id)
+                self._unsaved_ids.append(email.message_id)
+                self._domain_counts[domain] += 1
+
+            learned = self._sender_scores.get(address)
+            # The tolerance keeps scores learned moments ago from missing the threshold by a rounding error
+            if learned is not None and learned["weight"] * self._decay(learned["updated_at"]) >= self.min_observations - 1e-6:
+                drop = learned["mean"] <= self.learned_drop_score and not self._is_rescored(email)
+                reason = f"learned score {learned['mean']:.1f}"
+            else:
+                bulk_score = self.bulk_score(email)
+                drop = bulk_score >= self.drop_score
+                reason = f"bulk score {bulk_score}"
+                if not drop and bulk_score >= self.downweight_score:
+                    self._weight_caps[email.message_id] = self.downweight_cap
+
+            if drop:
+                logger.debug(f"Dropped email {email.message_id} from {address}: {reason}")
+                self.dropped_count += 1
+                continue
+            self.kept_count += 1
+            yield email
+
+    def bulk_score(self, email: EmailMessage) -> int:
+        """
+        Score how likely an email is bulk mail, from 0 upwards.
+        """
+        headers = {name.lower(): value.lower() for name, value in email.headers.items()}
+        address = self._address(email)
+        local_part, _, domain = address.rpartition("@")
+
+        score = 0
+        if "list-unsubscribe" in headers:
+            score += 2
+        if headers.get("precedence", "").strip() in ("bulk", "list", "junk"):
+            score += 2
+        if "list-id" in headers:
+            score += 1
+        if headers.get("auto-submitted", "no").strip() != "no":
+            score += 1
+        if AUTOMATED_SENDER_PATTERN.search(local_part):
+            score += 1
+        if self._domain_counts[domain] >= self.frequent_domain_count:
+            score += 1
+        return score
+
+    def weight_cap(self, email: EmailMessage) -> Optional[int]:
+        """
+        Maximum hypothesis weight of a kept email, None if it is not down-weighted.
+        """
+        return self._weight_caps.pop(email.message_id, None)
+
+    def end_batch(self, emails: List[EmailMessage]) -> None:
+        """
+        Forget the weight caps of a processed batch, including those of emails whose hypotheses were never read.
+        """
+        for email in emails:
+            self._weight_caps.pop(email.message_id, None)
+
+    def learn(self, email: EmailMessage, score: int) -> None:
+        """
+        Record a uniqueness score the LLM gave to an email of this sender.
+        """
+        now = time.time()
+        learned = self._sender_scores.get(self._address(email))
+        if learned is None:
+            self._sender_scores[self._address(email)] = {"weight": 1.0, "mean": float(score), "updated_at": now}
+            return
+        weight = learned["weight"] * self._decay(learned["updated_at"], now)
+        learned["mean"] = (learned["mean"] * weight + score) / (weight + 1)
+        learned["weight"] = weight + 1
+        learned["updated_at"] = now
+
+    def save(self) -> None:
+        """
+        Persist learned sender scores and domain counts, dropping scores that have all but decayed away.
+        """
+        if self._unsaved_ids:
+            append_line(self._counted_ids_path, "\n".join(self._unsaved_ids))
+            self._unsaved_ids = []
+        now = time.time()
+        self._sender_scores = {address: learned for address, learned in self._sender_scores.items()
+                               if learned["weight"] * self._decay(learned["updated_at"], now) >= 0.05}
+        safe_write_file(self._path, json.dumps({
+            "senders": self._sender_scores,
+            "domains": dict(self._domain_counts),
+        }, indent=2))
+
+    def _load(self) -> None:
+        if os.path.exists(self._counted_ids_path):
+            with open(self._counted_ids_path, "r", encoding="utf-8") as f:
+                self._counted_ids = {line.strip() for line in f if line.strip()}
+        if not os.path.exists(self._path):
+            return
+        with open(self._path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        now = time.time()
+        # Scores saved before they decayed only have a count, they are taken as observed now
+        self._sender_scores = {address: learned if "weight" in learned else {"weight": learned["count"], "mean": learned["mean"], "updated_at": now}
+                               for address, learned in state.get("senders", {}).items()}
+        self._domain_counts = Counter(state.get("domains", {}))
+
+    def _decay(self, updated_at: float, now: Optional[float] = None) -> float:
+        age = (now if now is not None else time.time()) - updated_at
+        return 0.5 ** (max(0.0, age) / self.half_life_seconds)
+
+    def _is_rescored(self, email: EmailMessage) -> bool:
+        """
+        Whether an email of a dropped sender is in the sample kept to be scored again, stable across runs.
+        """
+        digest = hashlib.sha256(email.message_id.encode('utf-8')).digest()
+        return int.from_bytes(digest[:4], "big") < self.rescore_rate * 2 ** 32
+
+    @staticmethod
+    def _address(email: EmailMessage) -> str:
+        return parseaddr(email.sender or "")[1].lower()
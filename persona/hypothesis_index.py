@@ -0,0 +1,86 @@
+from typing import TYPE_CHECKING, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from common.text_similarity import MinHashIndex, jaccard, normalize_text, tokenize
+
+if TYPE_CHECKING:
+    from persona.pesrona_builder import PersonaHypothesis
+
+
+class HypothesisIndex:
+    """
+    Per-category index merging near-duplicate persona hypotheses.
+
+    Hypotheses with the same normalized text, or whose content words overlap by at least
+    `similarity_threshold` (Jaccard), collapse into one hypothesis that keeps the first description,
+    the highest weight, the accumulated weight and the number of supporting hypotheses.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.6):
+        """
+        Args:
+            similarity_threshold: Minimum Jaccard similarity of content words to merge two hypotheses
+        """
+        self.similarity_threshold = similarity_threshold
+        self._hypotheses: List['PersonaHypothesis'] = []
+        self._exact: Dict[Tuple[str, str], int] = {}
+        self._tokens: List[FrozenSet[str]] = []
+        self._minhash: Dict[str, MinHashIndex[int]] = {}
+
+    def add(self, hypothesis: 'PersonaHypothesis') -> bool:
+        """
+        Add a hypothesis, merging it into an existing one when they are near-duplicates.
+
+        Args:
+            hypothesis: Hypothesis to add
+
+        Returns:
+            True if the hypothesis was merged, False if it was added as a new one
+        """
+        exact_key = (hypothesis.category, normalize_text(hypothesis.description))
+        tokens = tokenize(hypothesis.description)
+
+        match = self._exact.get(exact_key)
+        if match is None:
+            match = self._find_similar(hypothesis.category, tokens)
+
+        if match is not None:
+            existing = self._hypotheses[match]
+            existing.weight = max(existing.weight, hypothesis.weight)
+            existing.total_weight += hypothesis.total_weight
+            existing.support += hypothesis.support
+            self._exact.setdefault(exact_key, match)
+            return True
+
+        position = len(self._hypotheses)
+        self._hypotheses.append(hypothesis)
+        self._tokens.append(tokens)
+        self._exact[exact_key] = position
+        self._minhash.setdefault(hypothesis.category, MinHashIndex()).insert(position, tokens)
+        return False
+
+    def extend(self, hypothesis_list: Iterable['PersonaHypothesis']) -> int:
+        """
+        Add many hypotheses.
+
+        Returns:
+            Number of hypotheses merged into existing ones
+        """
+        return sum(self.add(hypothesis) for hypothesis in hypothesis_list)
+
+    @property
+    def hypotheses(self) -> List['PersonaHypothesis']:
+        """
+        The merged hypotheses, in insertion order.
+        """
+        return self._hypotheses
+
+    def _find_similar(self, category: str, tokens: FrozenSet[str]) -> Optional[int]:
+        index = self._minhash.get(category)
+        if index is None or not tokens:
+            return None
+        best, best_similarity = None, 0.0
+        for position in sorted(index.query(tokens)):
+            similarity = jaccard(tokens, self._tokens[position])
+            if similarity >= self.similarity_threshold and similarity > best_similarity:
+                best, best_similarity = position, similarity
+        return best
@@ -1,8 +1,11 @@
+import asyncio
+import hashlib
 import json
-from common.utils import safe_write_file
-from typing import Dict, List
+import os
+from common.utils import append_line, prefetch, safe_write_file
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from common.logger import get_logger
 
 from data_loader.base_email_fetcher import EmailMessage
@@ -11,6 +14,10 @@ from llm.templates.onboarding.biography_formation import BiographyFormationPromp
 from llm.templates.onboarding.biography_writing import BiographyWritingPrompt
 from llm.templates.onboarding.email_uniqueness_batch import EmailUniquenessPrompt
 from llm.templates.onboarding.persona_extraction_batch import PersonaExtractionBatchPrompt
+from llm.token_budget import estimate_tokens, pack_batches
+from persona.email_prefilter import EmailPrefilter
+from persona.hypothesis_index import HypothesisIndex
+from persona.uniqueness_cache import UniquenessCache
 
 
 logger = get_logger(__name__)
@@ -20,10 +27,19 @@ class PersonaHypothesis(BaseModel):
     category: str
     description: str
     weight: int
+    # Number of near-duplicate hypotheses merged into this one, and the sum of their weights
+    support: int = 1
+    total_weight: Optional[int] = None
 
     class Config:
         extra = 'allow'
 
+    @model_validator(mode='after')
+    def _default_total_weight(self) -> 'PersonaHypothesis':
+        if self.total_weight is None:
+            self.total_weight = self.weight
+        return self
+
 
 class PersonaBuilder:
     """
@@ -32,12 +48,51 @@ class PersonaBuilder:
 
     persona_hypothesis_list: List[PersonaHypothesis]
 
-    def __init__(self, llm_client: BaseLLMClient, storage_path: str):
+    def __init__(self,
+                 llm_client: BaseLLMClient,
+                 storage_path: str,
+                 token_budget: int = 2048,
+                 max_batch_size: int = 25,
+                 persona_write_interval: int = 1,
+                 prefilter: Optional[EmailPrefilter] = None,
+                 uniqueness_cache: Optional[UniquenessCache] = None,
+                 snapshot_interval: int = 20):
+        """
+        Args:
+            llm_client: Client used to prompt the LLM
+            storage_path: Directory where the hypothesis log, snapshots and persona are written
+            token_budget: Estimated prompt plus response tokens allowed per batched prompt, should fit the model's context
+            max_batch_size: Upper bound on the number of emails per batched prompt
+            persona_write_interval: Rewrite the biography every K batches. 0 only writes it once all emails are digested
+            prefilter: Drops or down-weights bulk emails before they are sent to the LLM, and learns from uniqueness scores
+            uniqueness_cache: Scores emails of known senders without prompting the LLM, and learns from uniqueness scores
+            snapshot_interval: Compact the hypothesis log into a snapshot every K batches
+        """
         self._llm_client = llm_client
-        self._email_batch_size = 10
-        self._persona_hypothesis_list = []
+        self._token_budget = token_budget
+        self._max_batch_size = max_batch_size
+        # Adapted while digesting: halved when a response is truncated or misses emails, grown back by one on success
+        self._email_batch_size = max_batch_size
+        self._output_tokens_per_email = 60
+        # Near-duplicate hypotheses are merged as they are added, so the list stays roughly flat as history grows
+        self._hypothesis_index = HypothesisIndex()
+        self._persona_hypothesis_list = self._hypothesis_index.hypotheses
         self._storage_path = f"{storage_path}/persona"
+        self._log_path = f"{self._storage_path}/hypothesis.log"
+        self._snapshot_path = f"{self._storage_path}/snapshot.json"
+        self._snapshot_interval = snapshot_interval
+        # Message IDs of digested emails, so a resumed digest skips them instead of re-sending batches
+        self._digested_ids: Set[str] = set()
+        # Number of batches digested so far, and how many of them the latest snapshot covers
+        self._batch_count = 0
+        self._snapshot_batch = 0
         self._persona = None
+        self._persona_write_interval = persona_write_interval
+        self._prefilter = prefilter
+        self._uniqueness_cache = uniqueness_cache
+        # Category -> (hash of the kept hypotheses, formed description), so unchanged categories are not re-prompted
+        self._formation_cache: Dict[str, Tuple[str, str]] = {}
+        self._draft_hash: Optional[str] = None
 
     def get_persona(self):
         return self._persona
@@ -47,69 +102,186 @@ class PersonaBuilder:
         Digest emails into persona hypothesis by batches.
         All the hypothesis will be stored accumulatively.
         After each batch run, it will generate a biography with all accumulated hypothesis, and create a persona checkpoint.
+        Emails digested before (e.g. in an interrupted run) are skipped.
+
+        Note: should call load_checkpoint() to load previous data into the instance first.
+        """
+        self.digest_stream(emails, prefetch_batches=0)
 
-        Note: should call _load_hypothesis() to load previous data into the instance first.
+    def digest_stream(self, emails: Iterable[EmailMessage], prefetch_batches: int = 2):
         """
-        email_batches = [emails[i:i + self._email_batch_size] for i in range(0, len(emails), self._email_batch_size)]
+        Same as digest_emails(), but consumes emails from an iterable (e.g. a fetcher's `iter_emails()`) batch by batch.
 
-        for idx, email_batch in enumerate(email_batches):
+        Up to `prefetch_batches` batches are pulled from the iterable in the background while a batch is being digested,
+        so fetching overlaps with LLM work and memory stays bounded by the batch size.
+        """
+        if prefetch_batches > 0:
+            emails = prefetch(emails, buffer_size=prefetch_batches * self._email_batch_size)
+        emails = (email for email in emails if email.message_id not in self._digested_ids)
+        if self._prefilter is not None:
+            emails = self._prefilter.filter(emails)
+
+        idx = -1
+        persona_outdated = False
+        for idx, email_batch in enumerate(self._iter_batches(emails)):
             # Process emails and batch hypothesis
-            batch_hypothesis = self._process_emails(email_batch)
-            self._persona_hypothesis_list.extend(batch_hypothesis)
-            self._save_hypothesis(idx)
+            batch_hypothesis, digested_ids = self._process_emails(email_batch)
+            merged_count = self._commit_batch(digested_ids, batch_hypothesis)
+            logger.info(f"Batch {self._batch_count}: {len(batch_hypothesis)} hypothesis, {merged_count} merged into existing ones, {len(self._persona_hypothesis_list)} in total")
+            if self._prefilter is not None:
+                self._prefilter.end_batch(email_batch)
+                self._prefilter.save()
+            if self._uniqueness_cache is not None:
+                self._uniqueness_cache.save()
+            persona_outdated = True
 
             # Write biography with all accumulated hypothesis
+            if self._persona_write_interval > 0 and (idx + 1) % self._persona_write_interval == 0:
+                self._persona = self._write_persona(self._persona_hypothesis_list)
+                self._save_persona()
+                persona_outdated = False
+
+        if persona_outdated:
             self._persona = self._write_persona(self._persona_hypothesis_list)
-            self._save_persona(idx)
+            self._save_persona()
+        if self._batch_count > self._snapshot_batch:
+            self._save_snapshot()
+
+        if self._prefilter is not None:
+            logger.info(f"Pre-filter dropped {self._prefilter.dropped_count} of {self._prefilter.dropped_count + self._prefilter.kept_count} emails")
+        if self._uniqueness_cache is not None:
+            logger.info(f"Uniqueness cache scored {self._uniqueness_cache.hits} emails, {self._uniqueness_cache.misses} sent to the LLM")
 
-    def _process_emails(self, email_batch: List[EmailMessage]) -> List[PersonaHypothesis]:
+    def _iter_batches(self, emails: Iterable[EmailMessage]) -> Iterator[List[EmailMessage]]:
         """
-        Process email headers including subject, sender and recipient to extract implication from the email.
-        Return a list of hypothesis to the user persona.
+        Group a stream of emails into batches that fit the token budget, with at most `_email_batch_size` emails each.
         """
-
-        hypothesis_list: List[PersonaHypothesis] = []
-        params = {
-            "emails": [{
-                "idx": idx,
-                "subject": email.subject,
-                "date": email.date,
-                "sender": email.sender,
-                "recipient": email.to,
-            } for idx, email in enumerate(email_batch)]}
-
-        persona_extraction_batch_result = self._llm_client.prompt(
-            template=PersonaExtractionBatchPrompt,
-            template_params=params
+        template_tokens = max(
+            estimate_tokens(PersonaExtractionBatchPrompt.system_message + PersonaExtractionBatchPrompt.user_message),
+            estimate_tokens(EmailUniquenessPrompt.system_message + EmailUniquenessPrompt.user_message),
         )
-
-        email_uniqueness_result = self._llm_client.prompt(
-            template=EmailUniquenessPrompt,
-            template_params=params
+        return pack_batches(
+            emails,
+            cost=lambda email: estimate_tokens(str(self._email_params(0, email))) + self._output_tokens_per_email,
+            budget=self._token_budget - template_tokens,
+            max_items=lambda: self._email_batch_size,
         )
 
+    def _email_params(self, idx: int, email: EmailMessage) -> dict:
+        return {
+            "idx": idx,
+            "subject": email.subject,
+            "date": email.date,
+            "sender": email.sender,
+            "recipient": email.to,
+        }
+
+    def _process_emails(self, email_batch: List[EmailMessage]) -> Tuple[List[PersonaHypothesis], List[str]]:
+        """
+        Process email headers including subject, sender and recipient to extract implication from the email.
+        Return a list of hypothesis to the user persona, and the message IDs of the emails that got a result.
+        Emails without a result are left undigested, so a resumed digest tries them again.
+        """
+
+        hypothesis_list: List[PersonaHypothesis] = []
+        digested_ids: List[str] = []
+        params = {"emails": [self._email_params(idx, email) for idx, email in enumerate(email_batch)]}
+
+        # Emails of senders with a consistent score history are not scored by the LLM again
+        cached_scores: Dict[int, int] = {}
+        if self._uniqueness_cache is not None:
+            for idx, email in enumerate(email_batch):
+                score = self._uniqueness_cache.get(email)
+                if score is not None:
+                    cached_scores[idx] = score
+        uniqueness_params = {"emails": [p for p in params["emails"] if p["idx"] not in cached_scores]}
+
+        async def prompt_batch():
+            # Extraction and uniqueness scoring are independent of each other
+            prompts = [self._llm_client.aprompt_items(template=PersonaExtractionBatchPrompt, template_params=params)]
+            if uniqueness_params["emails"]:
+                prompts.append(self._llm_client.aprompt_items(template=EmailUniquenessPrompt, template_params=uniqueness_params))
+            return await asyncio.gather(*prompts)
+
+        results = asyncio.run(prompt_batch())
+        if any(not complete and not result.emails for result, complete in results):
+            # Nothing could be salvaged, usually a response truncated by the context window, retry with smaller batches
+            self._shrink_batch_size()
+            logger.warning(f"Invalid response for a batch of {len(email_batch)} emails")
+            return self._process_halves(email_batch)
+        (persona_extraction_batch_result, _), *email_uniqueness_results = results
+
+        llm_scores: Dict[int, int] = {}
+        for email_uniqueness_result, _ in email_uniqueness_results:
+            llm_scores.update({e.idx: e.score for e in email_uniqueness_result.emails if e.idx in range(len(email_batch)) and e.idx not in cached_scores})
+
+        missing_emails: List[EmailMessage] = []
         for idx, input_email in enumerate(email_batch):
 
             # Map the referenced email with the input email using "idx" field
             mapped_implication_email = next((e for e in persona_extraction_batch_result.emails if e.idx == idx), None)
-            mapped_uniqueness_email = next((e for e in email_uniqueness_result.emails if e.idx == idx), None)
+            weight = cached_scores.get(idx, llm_scores.get(idx))
 
-            if mapped_uniqueness_email is None or mapped_implication_email is None:
+            if weight is None or mapped_implication_email is None:
                 logger.error(f"Email {idx} not found in the result")
+                missing_emails.append(input_email)
                 continue
 
+            if idx in llm_scores:
+                if self._uniqueness_cache is not None:
+                    self._uniqueness_cache.learn(input_email, weight)
+                if self._prefilter is not None:
+                    self._prefilter.learn(input_email, weight)
+            if self._prefilter is not None:
+                weight_cap = self._prefilter.weight_cap(input_email)
+                if weight_cap is not None:
+                    weight = min(weight, weight_cap)
+
             for implication in mapped_implication_email.implications:
                 hypothesis_list.append(PersonaHypothesis(
                     category=implication.category,
                     description=implication.description,
-                    weight=mapped_uniqueness_email.score,
+                    weight=weight,
                 ))
-
-        return hypothesis_list
+            digested_ids.append(input_email.message_id)
+
+        if len(missing_emails) == len(email_batch):
+            self._shrink_batch_size()
+            logger.warning(f"No email of a batch of {len(email_batch)} emails found in the result")
+            return self._process_halves(email_batch)
+        if missing_emails:
+            self._shrink_batch_size()
+            # Keep the salvaged results and only prompt the missing emails again
+            logger.warning(f"Re-requesting {len(missing_emails)} of {len(email_batch)} emails missing from the result")
+            retried_hypothesis, retried_ids = self._process_emails(missing_emails)
+            hypothesis_list.extend(retried_hypothesis)
+            digested_ids.extend(retried_ids)
+        elif len(email_batch) >= self._email_batch_size:
+            self._email_batch_size = min(self._max_batch_size, self._email_batch_size + 1)
+
+        return hypothesis_list, digested_ids
+
+    def _process_halves(self, email_batch: List[EmailMessage]) -> Tuple[List[PersonaHypothesis], List[str]]:
+        """
+        Retry a batch that got no usable result in two halves, giving up on single emails.
+        """
+        if len(email_batch) == 1:
+            logger.error(f"Failed to process email {email_batch[0].message_id}: invalid response")
+            return [], []
+        logger.warning(f"Retrying a batch of {len(email_batch)} emails in halves")
+        half = len(email_batch) // 2
+        first_hypothesis, first_ids = self._process_emails(email_batch[:half])
+        second_hypothesis, second_ids = self._process_emails(email_batch[half:])
+        return first_hypothesis + second_hypothesis, first_ids + second_ids
+
+    def _shrink_batch_size(self) -> None:
+        self._email_batch_size = max(1, self._email_batch_size // 2)
+        logger.info(f"Reduced email batch size to {self._email_batch_size}")
 
     def _write_persona(self, hypothesis_list: List[PersonaHypothesis]) -> str:
         """
         Write a biography with all accumulated hypothesis.
+        Only categories whose kept hypotheses changed since the last write are formed again.
         """
 
         markdown = ""
@@ -121,45 +293,176 @@ class PersonaBuilder:
                 hypoethesis_by_category[hypothesis.category] = []
             hypoethesis_by_category[hypothesis.category].append(hypothesis)
 
+        kept_by_category: Dict[str, List[PersonaHypothesis]] = {}
         for category, hypothesis_list in hypoethesis_by_category.items():
-            # Sort implications by weight in descending order
-            sorted_hypothesis = sorted(hypothesis_list, key=lambda x: x.weight, reverse=True)
+            # Sort implications by accumulated weight in descending order, so well supported ones come first
+            sorted_hypothesis = sorted(hypothesis_list, key=lambda x: (x.total_weight, x.weight), reverse=True)
 
             # Keep top 50% of implications
             num_to_keep = max(1, len(sorted_hypothesis) // 2)  # Keep at least 1
-            hypothesis_list = sorted_hypothesis[:num_to_keep]
-            llm_result = self._llm_client.prompt(
+            kept_by_category[category] = sorted_hypothesis[:num_to_keep]
+
+        kept_hashes = {category: self._hash_hypothesis(kept) for category, kept in kept_by_category.items()}
+        dirty_categories = [category for category, kept_hash in kept_hashes.items()
+                            if self._formation_cache.get(category, (None,))[0] != kept_hash]
+
+        async def form_categories():
+            # Categories are formed independently, so run them concurrently
+            return await asyncio.gather(*[self._llm_client.aprompt(
                 template=BiographyFormationPrompt,
-                template_params={"implications": hypothesis_list},
-            )
-            markdown += f"## {category}\n\n{llm_result.description}\n\n"
+                template_params={"implications": kept_by_category[category]},
+            ) for category in dirty_categories])
+
+        if dirty_categories:
+            logger.info(f"Forming {len(dirty_categories)} of {len(kept_hashes)} persona categories: {dirty_categories}")
+            formation_results = asyncio.run(form_categories())
+            for category, llm_result in zip(dirty_categories, formation_results):
+                self._formation_cache[category] = (kept_hashes[category], llm_result.description)
+
+        for category in hypoethesis_by_category.keys():
+            markdown += f"## {category}\n\n{self._formation_cache[category][1]}\n\n"
+
+        # Nothing changed in the draft, the previous biography still holds
+        draft_hash = hashlib.sha256(markdown.encode('utf-8')).hexdigest()
+        if self._persona is not None and draft_hash == self._draft_hash:
+            return self._persona
 
         biography_writing_result = self._llm_client.prompt(
             template=BiographyWritingPrompt,
             template_params={"draft": markdown},
         )
+        self._draft_hash = draft_hash
 
         return biography_writing_result.biography
 
-    def _save_persona(self, checkpoint_idx: int) -> None:
+    @staticmethod
+    def _hash_hypothesis(hypothesis_list: List[PersonaHypothesis]) -> str:
+        # Support and total weight grow with nearly every batch, hashing them would re-form every category touched.
+        # A category is only re-formed when its kept descriptions or their weights change
+        payload = json.dumps(sorted((h.description, h.weight) for h in hypothesis_list), ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _commit_batch(self, message_ids: List[str], batch_hypothesis: List[PersonaHypothesis]) -> int:
         """
-        Save the biography into local storage.
+        Durably record a digested batch, then merge its hypothesis.
+
+        Args:
+            message_ids: Message IDs of the emails of the batch that got a result
+            batch_hypothesis: Hypothesis extracted from those emails
+
+        Returns:
+            Number of hypothesis merged into existing ones
         """
-        file_path = f"{self._storage_path}/checkpoint_{checkpoint_idx}/persona.txt"
-        safe_write_file(file_path, self._persona)
+        self._batch_count += 1
+
+        # Write-ahead: once the record is on disk, a resumed digest neither loses nor repeats the batch
+        append_line(self._log_path, json.dumps({
+            "batch": self._batch_count,
+            "message_ids": message_ids,
+            "hypothesis": [h.model_dump() for h in batch_hypothesis],
+        }, ensure_ascii=False))
+        merged_count = self._apply_batch(message_ids, batch_hypothesis)
+
+        if self._batch_count - self._snapshot_batch >= self._snapshot_interval:
+            self._save_snapshot()
+        return merged_count
 
-    def _save_hypothesis(self,  checkpoint_idx: int) -> None:
+    def _apply_batch(self, message_ids: List[str], batch_hypothesis: List[PersonaHypothesis]) -> int:
+        self._digested_ids.update(message_ids)
+        return self._hypothesis_index.extend(batch_hypothesis)
+
+    def _save_snapshot(self) -> None:
+        """
+        Compact the merged hypothesis and digested message IDs into a snapshot, then truncate the log.
         """
-        Save hypothesis list into local storage with a specific checkpoint index.
+        safe_write_file(self._snapshot_path, json.dumps({
+            "batch": self._batch_count,
+            "digested_ids": sorted(self._digested_ids),
+            "hypothesis": [h.model_dump() for h in self._persona_hypothesis_list],
+        }, ensure_ascii=False))
+        # A crash before the truncation is harmless, replay skips records the snapshot already covers
+        open(self._log_path, 'w').close()
+        self._snapshot_batch = self._batch_count
+
+    def _save_persona(self) -> None:
         """
-        file_path = f"{self._storage_path}/checkpoint_{checkpoint_idx}/hypothesis.json"
-        safe_write_file(file_path, json.dumps([i.model_dump() for i in self._persona_hypothesis_list], indent=2))
+        Save the biography and the formed category descriptions into local storage.
+        """
+        safe_write_file(f"{self._storage_path}/persona.txt", self._persona)
+        safe_write_file(f"{self._storage_path}/formation.json", json.dumps({
+            "draft_hash": self._draft_hash,
+            "categories": {category: {"hash": kept_hash, "description": description}
+                           for category, (kept_hash, description) in self._formation_cache.items()},
+        }, indent=2))
 
     def load_checkpoint(self, checkpoint_path: str) -> None:
         """
-        Load hypothesis list from the local storage with a specific checkpoint index.
+        Load the state of a previous digest, so it can be resumed or continued.
+
+        Args:
+            checkpoint_path: A persona storage directory (e.g. "./data/{run_id}/persona"),
+                or a legacy "checkpoint_{idx}" directory containing hypothesis.json
+        """
+        self._hypothesis_index = HypothesisIndex()
+        self._persona_hypothesis_list = self._hypothesis_index.hypotheses
+        self._digested_ids = set()
+        self._batch_count = 0
+
+        if os.path.exists(f"{checkpoint_path}/hypothesis.json"):
+            # Legacy checkpoints do not record digested emails. They may contain duplicates, which are merged while loading
+            with open(f"{checkpoint_path}/hypothesis.json", "r") as f:
+                self._hypothesis_index.extend(PersonaHypothesis(**item) for item in json.load(f))
+        else:
+            self._load_log(checkpoint_path)
+        self._snapshot_batch = self._batch_count
+
+        # Checkpoints between biography writes only contain hypothesis
+        if os.path.exists(f"{checkpoint_path}/persona.txt"):
+            with open(f"{checkpoint_path}/persona.txt", "r") as f:
+                self._persona = f.read()
+        if os.path.exists(f"{checkpoint_path}/formation.json"):
+            with open(f"{checkpoint_path}/formation.json", "r") as f:
+                formation = json.load(f)
+            self._draft_hash = formation["draft_hash"]
+            self._formation_cache = {category: (item["hash"], item["description"]) for category, item in formation["categories"].items()}
+
+        # Continue in this builder's own storage from the loaded state
+        if os.path.abspath(checkpoint_path) != os.path.abspath(self._storage_path):
+            self._save_snapshot()
+            if self._persona is not None:
+                self._save_persona()
+        logger.info(f"Loaded {len(self._persona_hypothesis_list)} hypothesis from {self._batch_count} batches, {len(self._digested_ids)} emails digested")
+
+    def _load_log(self, storage_path: str) -> None:
+        """
+        Load the latest snapshot of a persona storage directory, then replay the log records it does not cover.
         """
-        with open(f"{checkpoint_path}/hypothesis.json", "r") as f:
-            self._persona_hypothesis_list = [PersonaHypothesis(**item) for item in json.load(f)]
-        with open(f"{checkpoint_path}/persona.txt", "r") as f:
-            self._persona = f.read()
+        snapshot_batch = 0
+        if os.path.exists(f"{storage_path}/snapshot.json"):
+            with open(f"{storage_path}/snapshot.json", "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            snapshot_batch = snapshot["batch"]
+            self._apply_batch(snapshot["digested_ids"], [PersonaHypothesis(**item) for item in snapshot["hypothesis"]])
+        self._batch_count = snapshot_batch
+
+        log_path = f"{storage_path}/hypothesis.log"
+        if not os.path.exists(log_path):
+            return
+        valid_offset = 0
+        with open(log_path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn write of the last record before a crash, the batch was never applied
+                    logger.warning(f"Ignoring incomplete record at offset {valid_offset} of {log_path}")
+                    break
+                valid_offset += len(line)
+                if record["batch"] <= self._batch_count:
+                    continue
+                self._apply_batch(record["message_ids"], [PersonaHypothesis(**item) for item in record["hypothesis"]])
+                self._batch_count = record["batch"]
+
+        # Drop the torn record so new records are not appended after it
+        if os.path.abspath(log_path) == os.path.abspath(self._log_path) and valid_offset < os.path.getsize(log_path):
+            os.truncate(log_path, valid_offset)
@@ -0,0 +1,116 @@
+from email.utils import parseaddr
+import json
+import math
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+from common.utils import safe_write_file
+from data_loader.email_message import EmailMessage
+
+
+SENDER_WIDE = "*"
+
+
+class UniquenessCache:
+    """
+    Persistent memo of uniqueness scores by sender and subject template.
+
+    Scores are recorded under the sender with the subject's template (digits masked, reply prefixes removed)
+    and under the sender as a whole. A cached score is only used when enough recent observations agree:
+    observations lose weight with a half-life, so stale entries fall back to the LLM and are re-checked,
+    and keys whose scores vary too much are treated as ambiguous.
+    """
+
+    def __init__(self,
+                 storage_path: str,
+                 min_confidence: float = 2.0,
+                 max_stddev: float = 0.75,
+                 half_life_days: float = 30):
+        """
+        Args:
+            storage_path: Directory where the cache is persisted
+            min_confidence: Decayed number of observations needed before a cached score is used
+            max_stddev: Maximum standard deviation of the observed scores for a key to be used
+            half_life_days: Age after which an observation counts half
+        """
+        self.min_confidence = min_confidence
+        self.max_stddev = max_stddev
+        self.half_life_seconds = half_life_days * 24 * 3600
+        self._path = f"{storage_path}/uniqueness_cache.json"
+        # Key -> {"weight": decayed observation count, "mean": score mean, "sq_mean": mean of squared scores, "updated_at": epoch seconds}
+        self._entries: Dict[str, Dict[str, float]] = {}
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def get(self, email: EmailMessage) -> Optional[int]:
+        """
+        Cached uniqueness score of an email, None if it should be scored by the LLM.
+        """
+        for key in self._keys(email):
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            confidence = entry["weight"] * self._decay(entry["updated_at"])
+            stddev = math.sqrt(max(0.0, entry["sq_mean"] - entry["mean"] ** 2))
+            # The tolerance keeps scores learned moments ago from missing the threshold by a rounding error
+            if confidence >= self.min_confidence - 1e-6 and stddev <= self.max_stddev:
+                self.hits += 1
+                return round(entry["mean"])
+        self.misses += 1
+        return None
+
+    def learn(self, email: EmailMessage, score: int) -> None:
+        """
+        Record a uniqueness score the LLM gave to an email.
+        """
+        now = time.time()
+        for key in self._keys(email):
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = {"weight": 1.0, "mean": float(score), "sq_mean": float(score ** 2), "updated_at": now}
+                continue
+            weight = entry["weight"] * self._decay(entry["updated_at"], now)
+            total = weight + 1
+            entry["mean"] = (entry["mean"] * weight + score) / total
+            entry["sq_mean"] = (entry["sq_mean"] * weight + score ** 2) / total
+            entry["weight"] = total
+            entry["updated_at"] = now
+
+    def save(self) -> None:
+        """
+        Persist the cache, dropping entries whose observations have all but decayed away.
+        """
+        now = time.time()
+        self._entries = {key: entry for key, entry in self._entries.items()
+                         if entry["weight"] * self._decay(entry["updated_at"], now) >= 0.05}
+        safe_write_file(self._path, json.dumps(self._entries, indent=2))
+
+    def _load(self) -> None:
+        if not os.path.exists(self._path):
+            return
+        with open(self._path, "r", encoding="utf-8") as f:
+            self._entries = json.load(f)
+
+    def _decay(self, updated_at: float, now: Optional[float] = None) -> float:
+        age = (now if now is not None else time.time()) - updated_at
+        return 0.5 ** (max(0.0, age) / self.half_life_seconds)
+
+    @staticmethod
+    def _keys(email: EmailMessage) -> List[str]:
+        """
+        Cache keys of an email, most specific first.
+        """
+        sender = parseaddr(email.sender or "")[1].lower()
+        return [f"{sender}|{UniquenessCache.subject_template(email.subject)}", f"{sender}|{SENDER_WIDE}"]
+
+    @staticmethod
+    def subject_template(subject: str) -> str:
+        """
+        Reduce a subject to its template, e.g. "Re: Invoice #1234 for May 2024" -> "invoice # for may #".
+        """
+        subject = re.sub(r"^\s*((re|fwd?|aw|wg)\s*:\s*)+", "", subject or "", flags=re.IGNORECASE)
+        subject = re.sub(r"[\d#]+", "#", subject.lower())
+        return " ".join(subject.split())
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+from pydantic import BaseModel
+import pytest
+
+from llm.cache import LLMResponseCache
+from llm.clients.base_llm_client import BaseLLMClient
+from llm.metrics import LLMMetrics
+from llm.schemas.base import LLMRequest, LLMResponse, LLMTemplate, LLMTokenUsage
+
+
+class Email(BaseModel):
+    idx: int
+    summary: str
+
+
+class BatchResult(BaseModel):
+    emails: list[Email]
+
+
+BatchPrompt = LLMTemplate(
+    name="BatchPrompt",
+    system_message="Summarize the emails.",
+    user_message="{{{subjects}}}",
+    output_model=BatchResult,
+)
+
+
+class FakeLLMClient(BaseLLMClient):
+    default_model = "fake"
+
+    def __init__(self, responses, **kwargs):
+        super().__init__(**kwargs)
+        self.responses = list(responses)
+        self.requests = 0
+
+    def _request(self, prompt_input: LLMRequest) -> LLMResponse:
+        self.requests += 1
+        return LLMResponse(response_str=self.responses.pop(0), token_usage=LLMTokenUsage(input_token=10, output_token=5))
+
+
+COMPLETE = json.dumps({"emails": [{"idx": 0, "summary": "a"}, {"idx": 1, "summary": "b"}]})
+
+
+def test_items_are_cached_and_recorded():
+    metrics = LLMMetrics()
+    client = FakeLLMClient([COMPLETE], cache=LLMResponseCache(), metrics=metrics)
+
+    first, complete = client.prompt_items(template=BatchPrompt, template_params={"subjects": "x"})
+    second, _ = asyncio.run(client.aprompt_items(template=BatchPrompt, template_params={"subjects": "x"}))
+
+    assert complete and [e.summary for e in first.emails] == [e.summary for e in second.emails] == ["a", "b"]
+    assert client.requests == 1
+    counters = metrics.snapshot()["BatchPrompt"]["fake"]
+    assert (counters["requests"], counters["cache_hits"], counters["input_tokens"]) == (2, 1, 10)
+
+
+def test_truncated_items_are_salvaged_and_not_cached():
+    metrics = LLMMetrics()
+    client = FakeLLMClient([COMPLETE[:-20], COMPLETE[:-20]], cache=LLMResponseCache(), metrics=metrics)
+
+    result, complete = client.prompt_items(template=BatchPrompt, template_params={"subjects": "x"})
+    client.prompt_items(template=BatchPrompt, template_params={"subjects": "x"})
+
+    assert not complete and [e.idx for e in result.emails] == [0]
+    assert client.requests == 2
+    assert metrics.snapshot()["BatchPrompt"]["fake"]["parse_failures"] == 2
+
+
+def test_parse_failure_raises_and_is_recorded():
+    metrics = LLMMetrics()
+    client = FakeLLMClient(["not json"], metrics=metrics)
+
+    with pytest.raises(json.JSONDecodeError):
+        asyncio.run(client.aprompt(template=BatchPrompt, template_params={"subjects": "x"}))
+
+    assert metrics.snapshot()["BatchPrompt"]["fake"]["parse_failures"] == 1
@@ -0,0 +1,35 @@
+import time
+
+from llm.cache import LLMResponseCache
+from llm.schemas.base import LLMResponse, LLMTokenUsage
+
+RESPONSE = LLMResponse(response_str="{}", token_usage=LLMTokenUsage(input_token=1, output_token=1))
+
+
+def test_memory_hits_keep_entries_from_eviction(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.db"), max_entries=10, evict_to_ratio=0.5)
+    cache.set("hot", RESPONSE)
+    for i in range(10):
+        cache.set(f"cold{i}", RESPONSE)
+        assert cache.get("hot") is not None
+    cache.close()
+
+    reopened = LLMResponseCache(str(tmp_path / "cache.db"), memory_size=0)
+    assert reopened.get("hot") is not None
+    assert reopened.get("cold0") is None
+
+
+def test_memory_tier_expires_entries():
+    cache = LLMResponseCache(ttl_seconds=1)
+    cache.set("key", RESPONSE)
+    assert cache.get("key") is not None
+    cache._memory["key"] = (time.time() - 2, RESPONSE)
+    assert cache.get("key") is None
+
+
+def test_store_is_bounded(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.db"), max_entries=100)
+    for i in range(250):
+        cache.set(f"key{i}", RESPONSE)
+    (count,) = cache._conn.execute("SELECT COUNT(*) FROM llm_response").fetchone()
+    assert count <= 100
@@ -0,0 +1,40 @@
+import base64
+import hashlib
+import json
+
+from data_loader.blob_store import BlobStore
+from data_loader.email_message import Attachment
+from data_loader.email_store import JsonFileEmailStore
+
+LEGACY_EMAIL = {
+    "subject": "Invoice",
+    "sender": "billing@example.com",
+    "to": "me@example.com",
+    "cc": None,
+    "date": "2024-01-01T10:00:00",
+    "body": "Please find the invoice attached.",
+    "attachments": [{"filename": "invoice.pdf", "content_type": "application/pdf", "data": base64.b64encode(b"%PDF-1.4").decode()}],
+    "message_id": "<legacy@example.com>",
+    "provider": "gmail",
+}
+
+
+def test_reads_legacy_inline_attachment(tmp_path):
+    (tmp_path / "gmail").mkdir()
+    (tmp_path / "gmail" / "20240101_100000_<legacy@example.com>.json").write_text(json.dumps(LEGACY_EMAIL))
+
+    email = JsonFileEmailStore(tmp_path).get("<legacy@example.com>")
+
+    attachment = email.attachments[0]
+    assert attachment.sha256 == hashlib.sha256(b"%PDF-1.4").hexdigest()
+    assert attachment.size == 8
+    assert attachment.load() == b"%PDF-1.4"
+
+
+def test_binding_moves_legacy_content_to_blob_store(tmp_path):
+    blob_store = BlobStore(tmp_path / "blobs")
+    attachment = Attachment.model_validate(LEGACY_EMAIL["attachments"][0]).bind(blob_store)
+
+    assert attachment.data is None
+    assert blob_store.exists(attachment.sha256)
+    assert attachment.load() == b"%PDF-1.4"
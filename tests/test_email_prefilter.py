@@ -0,0 +1,43 @@
+from datetime import datetime
+import time
+
+from data_loader.email_message import EmailMessage
+from persona.email_prefilter import EmailPrefilter
+
+
+def make_email(i: int, sender: str = "news@shop.com", headers=None) -> EmailMessage:
+    return EmailMessage(subject=f"Offer {i}", sender=sender, to="me@example.com", cc=None, date=datetime(2024, 1, 1),
+                        body="", attachments=[], message_id=f"<{i}@shop.com>", provider="gmail", headers=headers or {})
+
+
+def test_counts_each_email_once_across_runs(tmp_path):
+    prefilter = EmailPrefilter(str(tmp_path))
+    list(prefilter.filter([make_email(i) for i in range(3)]))
+    list(prefilter.filter([make_email(i) for i in range(3)]))
+    prefilter.save()
+
+    reloaded = EmailPrefilter(str(tmp_path))
+    list(reloaded.filter([make_email(i) for i in range(4)]))
+
+    assert reloaded._domain_counts["shop.com"] == 4
+
+
+def test_drops_low_scored_sender_but_rescores_a_sample(tmp_path):
+    prefilter = EmailPrefilter(str(tmp_path), rescore_rate=0.1)
+    for i in range(3):
+        prefilter.learn(make_email(i), 1)
+
+    kept = list(prefilter.filter([make_email(i) for i in range(100, 1100)]))
+
+    assert 50 < len(kept) < 150
+
+
+def test_learned_scores_decay(tmp_path):
+    prefilter = EmailPrefilter(str(tmp_path), half_life_days=1, rescore_rate=0)
+    for i in range(3):
+        prefilter.learn(make_email(i), 1)
+    assert list(prefilter.filter([make_email(100)])) == []
+
+    # Two days later the three scores count as 0.75 observations, below the 3 needed to trust them
+    prefilter._sender_scores["news@shop.com"]["updated_at"] = time.time() - 2 * 24 * 3600
+    assert len(list(prefilter.filter([make_email(101)]))) == 1
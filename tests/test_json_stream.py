@@ -0,0 +1,37 @@
+import json
+
+from pydantic import BaseModel
+
+from llm.json_stream import JsonItemStream
+
+
+class Email(BaseModel):
+    idx: int
+    summary: str
+
+
+RESPONSE = json.dumps({
+    "thought": "the [emails] key } is in a string",
+    "emails": [
+        {"idx": 0, "summary": "Dinner {at 8}, bring \"wine\" [red]"},
+        {"idx": 1, "summary": "Invoice"},
+        {"idx": "bad", "summary": "Invalid item"},
+        {"idx": 3, "summary": "Flight"},
+    ],
+})
+
+
+def test_items_split_across_every_chunk_boundary():
+    for size in range(1, 12):
+        stream = JsonItemStream("emails", Email)
+        for start in range(0, len(RESPONSE), size):
+            stream.feed(RESPONSE[start:start + size])
+        assert [email.idx for email in stream.items] == [0, 1, 3]
+        assert stream.items[0].summary == 'Dinner {at 8}, bring "wine" [red]'
+        assert stream.invalid_count == 1
+
+
+def test_truncated_response_keeps_complete_items():
+    stream = JsonItemStream("emails", Email)
+    stream.feed(RESPONSE[:RESPONSE.index('"Invoice"') + 5])
+    assert [email.idx for email in stream.items] == [0]
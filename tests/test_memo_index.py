@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+from memoboard.memo_index import MemoIndex
+from memoboard.memo_store import Memo, SourceMessage
+from memoboard.memoboard_builder import MemoboardBuilder
+
+
+def make_memo(details: str, message_id: str, date: datetime = datetime(2024, 5, 1), categories=("financial",)) -> Memo:
+    return Memo(
+        type="actionable",
+        source=SourceMessage(date=date, summary="summary", message_id=message_id),
+        categories=list(categories),
+        details=details,
+        summary="summary",
+    )
+
+
+def test_finds_exact_and_near_duplicates():
+    index = MemoIndex()
+    index.add(1, make_memo("Pay the electricity bill of May before the 20th", "m1"))
+    assert index.find(make_memo("pay the electricity bill of may before the 20th!", "m2")) == 1
+    assert index.find(make_memo("Pay the electricity bill of May before the 20th please", "m2")) == 1
+    assert index.find(make_memo("Renew the passport at the consulate", "m2")) is None
+
+
+def test_ignores_other_categories_and_old_memos():
+    index = MemoIndex(window_days=30)
+    index.add(1, make_memo("Pay the electricity bill of May before the 20th", "m1"))
+    assert index.find(make_memo("Pay the electricity bill of May before the 20th", "m2", categories=("household",))) is None
+    assert index.find(make_memo("Pay the electricity bill of May before the 20th", "m2", date=datetime(2024, 5, 1) + timedelta(days=60))) is None
+
+
+def test_collapses_duplicates_within_an_email_after_a_merge(tmp_path):
+    builder = MemoboardBuilder(None, "persona", str(tmp_path))
+    builder._save_deduplicated([make_memo("Pay the electricity bill of May before the 20th", "m1")], "m1")
+
+    builder._save_deduplicated([
+        make_memo("Pay the electricity bill of May before the 20th", "m2"),
+        make_memo("Book the car service appointment for next Tuesday morning", "m2"),
+        make_memo("Book the car service appointment for next Tuesday morning please", "m2"),
+    ], "m2")
+
+    assert builder.memo_store.count() == 2
+    assert builder.merged_count == 1
+    assert [len(memo.sources) for memo in builder.memo_store.query(category="financial")] == [1, 2]
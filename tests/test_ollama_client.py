@@ -0,0 +1,25 @@
+import random
+
+from llm.clients.ollama_client import OllamaClient
+from llm.schemas.base import LLMRequest
+
+SYSTEM_MESSAGE = "persona " * 1500
+
+
+def test_reports_no_reuse_when_every_prompt_is_evaluated():
+    client = OllamaClient()
+    rng = random.Random(0)
+    cached = 0
+    for _ in range(50):
+        user_tokens = rng.randint(50, 700)
+        request = LLMRequest(system_message=SYSTEM_MESSAGE, user_message="word " * user_tokens)
+        cached += client._token_usage({"prompt_eval_count": 1500 + user_tokens, "eval_count": 10}, request).cached_input_token
+    assert cached == 0
+
+
+def test_reports_reuse_of_the_system_message():
+    client = OllamaClient()
+    first = LLMRequest(system_message=SYSTEM_MESSAGE, user_message="word " * 300)
+    second = LLMRequest(system_message=SYSTEM_MESSAGE, user_message="word " * 400)
+    assert client._token_usage({"prompt_eval_count": 1800}, first).cached_input_token == 0
+    assert client._token_usage({"prompt_eval_count": 400}, second).cached_input_token == 1400
@@ -0,0 +1,95 @@
+from datetime import datetime
+import json
+import re
+from typing import Set
+
+from data_loader.email_message import EmailMessage
+from llm.clients.base_llm_client import BaseLLMClient
+from llm.schemas.base import LLMRequest, LLMResponse, LLMTokenUsage
+from persona.pesrona_builder import PersonaBuilder
+
+
+class FakeLLMClient(BaseLLMClient):
+    """Answers every prompt, leaving out the emails whose subject is in `skipped_subjects`."""
+
+    def __init__(self, skipped_subjects: Set[str] = frozenset()):
+        super().__init__()
+        self.skipped_subjects = set(skipped_subjects)
+
+    def _request(self, prompt_input: LLMRequest) -> LLMResponse:
+        emails = [(int(idx), subject) for idx, subject in re.findall(r"Idx: (\d+)\s*\nSubject: (.*)", prompt_input.user_message)]
+        emails = [(idx, subject) for idx, subject in emails if subject not in self.skipped_subjects]
+        if prompt_input.template_name == "PersonaExtractionBatchPrompt":
+            output = {"emails": [{"idx": idx, "implications": [{"category": "interests", "description": f"Reads about {subject}"}]}
+                                 for idx, subject in emails]}
+        elif prompt_input.template_name == "EmailUniquenessBatchPrompt":
+            output = {"emails": [{"idx": idx, "reasoning": "", "score": 3} for idx, _ in emails]}
+        elif prompt_input.template_name == "BiographyWritingPrompt":
+            output = {"biography": "biography"}
+        else:
+            output = {"description": "description"}
+        return LLMResponse(response_str=json.dumps(output), token_usage=LLMTokenUsage(input_token=1, output_token=1))
+
+
+TOPICS = ["gardening", "chess", "sailing", "pottery", "astronomy", "baking"]
+
+
+def make_email(i: int) -> EmailMessage:
+    return EmailMessage(subject=TOPICS[i], sender=f"sender{i}@example.com", to="me@example.com", cc=None,
+                        date=datetime(2024, 1, 1), body="", attachments=[], message_id=f"<{i}@example.com>", provider="gmail")
+
+
+def test_resume_replays_snapshot_and_log(tmp_path):
+    builder = PersonaBuilder(FakeLLMClient(), str(tmp_path), max_batch_size=2, snapshot_interval=2)
+    builder.digest_emails([make_email(i) for i in range(6)])
+
+    resumed = PersonaBuilder(FakeLLMClient(), str(tmp_path), max_batch_size=2, snapshot_interval=2)
+    resumed.load_checkpoint(f"{tmp_path}/persona")
+
+    assert resumed._digested_ids == {f"<{i}@example.com>" for i in range(6)}
+    assert sorted(h.description for h in resumed._persona_hypothesis_list) == sorted(h.description for h in builder._persona_hypothesis_list)
+    assert resumed._batch_count == builder._batch_count
+
+
+def test_ignores_torn_log_record(tmp_path):
+    builder = PersonaBuilder(FakeLLMClient(), str(tmp_path), max_batch_size=2)
+    builder.digest_emails([make_email(i) for i in range(2)])
+    with open(f"{tmp_path}/persona/hypothesis.log", "a") as f:
+        f.write('{"batch": 2, "message_ids": ["<9@exa')
+
+    resumed = PersonaBuilder(FakeLLMClient(), str(tmp_path), max_batch_size=2)
+    resumed.load_checkpoint(f"{tmp_path}/persona")
+
+    assert resumed._digested_ids == {"<0@example.com>", "<1@example.com>"}
+
+
+def test_emails_without_result_are_retried_on_resume(tmp_path):
+    builder = PersonaBuilder(FakeLLMClient(skipped_subjects={"chess"}), str(tmp_path), max_batch_size=4)
+    builder.digest_emails([make_email(i) for i in range(4)])
+    assert "<1@example.com>" not in builder._digested_ids
+
+    resumed = PersonaBuilder(FakeLLMClient(), str(tmp_path), max_batch_size=4)
+    resumed.load_checkpoint(f"{tmp_path}/persona")
+    assert resumed._digested_ids == {"<0@example.com>", "<2@example.com>", "<3@example.com>"}
+    resumed.digest_emails([make_email(i) for i in range(4)])
+    assert "Reads about chess" in {h.description for h in resumed._persona_hypothesis_list}
+
+
+def test_batch_missing_every_email_is_retried_in_halves(tmp_path):
+    client = FakeLLMClient()
+    builder = PersonaBuilder(client, str(tmp_path), max_batch_size=4)
+    original_request = client._request
+    failed_once = []
+
+    def request(prompt_input: LLMRequest) -> LLMResponse:
+        # The first extraction of the whole batch answers for none of its emails
+        if prompt_input.template_name == "PersonaExtractionBatchPrompt" and not failed_once:
+            failed_once.append(True)
+            return LLMResponse(response_str=json.dumps({"emails": []}), token_usage=LLMTokenUsage(input_token=1, output_token=1))
+        return original_request(prompt_input)
+
+    client._request = request
+    builder.digest_emails([make_email(i) for i in range(4)])
+
+    assert builder._digested_ids == {f"<{i}@example.com>" for i in range(4)}
+    assert {h.description for h in builder._persona_hypothesis_list} == {f"Reads about {topic}" for topic in TOPICS[:4]}
@@ -0,0 +1,41 @@
+import pytest
+
+from llm.rate_limiter import RateLimiter, parse_duration
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("7.66s", 7.66),
+    ("2m59.56s", 179.56),
+    ("120ms", 0.12),
+    ("1h", 3600),
+    ("12", 12),
+    ("", None),
+    (None, None),
+    ("soon", None),
+])
+def test_parse_duration(value, seconds):
+    if seconds is None:
+        assert parse_duration(value) is None
+    else:
+        assert parse_duration(value) == pytest.approx(seconds)
+
+
+def test_waits_once_the_reported_quota_is_spent():
+    limiter = RateLimiter()
+    assert limiter.reserve(1000) == 0
+    limiter.update({
+        "x-ratelimit-limit-tokens": "6000",
+        "x-ratelimit-remaining-tokens": "1000",
+        "x-ratelimit-reset-tokens": "50s",
+    })
+    # 5000 tokens refill in 50s, so 100 tokens a second
+    assert limiter.reserve(1000) == pytest.approx(0, abs=0.1)
+    assert limiter.reserve(500) == pytest.approx(5, abs=0.1)
+
+
+def test_ignores_missing_headers_and_honours_blocks():
+    limiter = RateLimiter(requests_per_minute=60)
+    limiter.update({"x-ratelimit-limit-requests": "not a number"})
+    assert limiter.reserve(10) == 0
+    limiter.block(3)
+    assert limiter.reserve(10) == pytest.approx(3, abs=0.1)
@@ -0,0 +1,31 @@
+import random
+import zlib
+
+from common.text_similarity import _MERSENNE_PRIME, MinHashIndex, tokenize
+
+
+def test_permutations_pick_different_minima():
+    index = MinHashIndex()
+    tokens = [f"token{i}" for i in range(50)]
+    hashes = {token: zlib.crc32(token.encode('utf-8')) for token in tokens}
+    minima = {min(tokens, key=lambda token: (a * hashes[token] + b) % _MERSENNE_PRIME) for a, b in index._permutations}
+    assert len(minima) > 1
+
+
+def test_near_duplicates_are_candidates():
+    rng = random.Random(1)
+    vocabulary = [f"w{i}" for i in range(1000)]
+    found = 0
+    for trial in range(200):
+        # Two sets of 40 shared + 10 own tokens, Jaccard 40/60 ~ 0.67
+        words = rng.sample(vocabulary, 60)
+        a, b = words[:50], words[:40] + words[50:]
+        index = MinHashIndex()
+        index.insert("a", a)
+        found += "a" in index.query(b)
+    # Banding with 8 bands of 4 rows gives 1 - (1 - 0.67^4)^8 ~ 0.83
+    assert found / 200 > 0.75
+
+
+def test_tokenize_ignores_stopwords():
+    assert tokenize("The bill of the month") == frozenset({"bill", "month"})
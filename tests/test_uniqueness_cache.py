@@ -0,0 +1,21 @@
+from datetime import datetime
+
+from data_loader.email_message import EmailMessage
+from persona.uniqueness_cache import UniquenessCache
+
+
+def make_email(subject: str) -> EmailMessage:
+    return EmailMessage(subject=subject, sender="Bank <alerts@bank.com>", to="me@example.com", cc=None, date=datetime(2024, 1, 1),
+                        body="", attachments=[], message_id=f"<{subject}@bank.com>", provider="gmail")
+
+
+def test_uses_score_once_enough_observations_agree(tmp_path):
+    cache = UniquenessCache(str(tmp_path), min_confidence=2)
+    cache.learn(make_email("Statement 1"), 2)
+    assert cache.get(make_email("Statement 2")) is None
+    cache.learn(make_email("Statement 3"), 2)
+    assert cache.get(make_email("Statement 4")) == 2
+
+
+def test_subject_template_masks_numbers_and_reply_prefixes():
+    assert UniquenessCache.subject_template("Re: Invoice #1234 for May 2024") == "invoice # for may #"